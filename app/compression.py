@@ -0,0 +1,194 @@
+import threading
+import time
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # Без пакета Brotli ответы сжимаются только gzip
+    brotli = None
+
+GZIP = "gzip"
+BROTLI = "br"
+# При равном q предпочтение в этом порядке
+ENCODINGS = (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+
+def choose_encoding(accept_encoding: str):
+    """Best supported content coding from Accept-Encoding, None for identity"""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+
+    best, best_quality = None, 0.0
+    for coding in ENCODINGS:
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class CompressionStats:
+    """Byte and CPU time counters per content coding"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int, cpu_seconds: float = 0.0, cached: bool = False):
+        """cached - тело взято из кэша ответов уже сжатым, CPU на сжатие не тратился"""
+        with self._lock:
+            counters = self._counters.setdefault(encoding, {
+                "responses": 0, "cached_responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0,
+            })
+            counters["responses"] += 1
+            counters["cached_responses"] += int(cached)
+            counters["bytes_in"] += bytes_in
+            counters["bytes_out"] += bytes_out
+            counters["cpu_seconds"] += cpu_seconds
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for encoding, counters in self._counters.items():
+                result[encoding] = dict(
+                    counters,
+                    ratio=counters["bytes_out"] / counters["bytes_in"] if counters["bytes_in"] else None,
+                )
+            return result
+
+
+class Compressor:
+    """gzip / brotli compression with a minimum body size, shared by the middleware and the response cache"""
+
+    def __init__(self, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5, stats=None):
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.stats = stats or CompressionStats()
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        started = time.thread_time()
+        if encoding == BROTLI:
+            compressed = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)  # 31 - заголовок gzip
+            compressed = compressor.compress(body) + compressor.flush()
+        self.stats.record(encoding, len(body), len(compressed), time.thread_time() - started)
+        return compressed
+
+    def stream(self, encoding: str):
+        return _StreamCompressor(self, encoding)
+
+
+class _StreamCompressor:
+    """Incremental compression of a chunked body; each chunk is flushed so it reaches the client at once"""
+
+    def __init__(self, compressor: Compressor, encoding: str):
+        self.compressor = compressor
+        self.encoding = encoding
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+        if encoding == BROTLI:
+            self._impl = brotli.Compressor(quality=compressor.brotli_quality)
+        else:
+            self._impl = zlib.compressobj(compressor.gzip_level, zlib.DEFLATED, 31)
+
+    def feed(self, chunk: bytes, last: bool) -> bytes:
+        started = time.thread_time()
+        if self.encoding == BROTLI:
+            data = self._impl.process(chunk) + (self._impl.finish() if last else self._impl.flush())
+        else:
+            data = self._impl.compress(chunk) + self._impl.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+        self.cpu_seconds += time.thread_time() - started
+        self.bytes_in += len(chunk)
+        self.bytes_out += len(data)
+        if last:
+            self.compressor.stats.record(self.encoding, self.bytes_in, self.bytes_out, self.cpu_seconds)
+        return data
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses by Accept-Encoding
+
+    Ответы, уже имеющие Content-Encoding (сжатые тела из кэша ответов), передаются как есть;
+    потоковые ответы сжимаются по частям.
+    """
+
+    def __init__(self, app, get_compressor):
+        """get_compressor - функция, возвращающая Compressor; вызывается при первом запросе"""
+        self.app = app
+        self.get_compressor = get_compressor
+        self.compressor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.compressor is None:
+            self.compressor = self.get_compressor()
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, self.compressor, encoding))
+
+
+class _CompressingSend:
+    def __init__(self, send, compressor: Compressor, encoding: str):
+        self.send = send
+        self.compressor = compressor
+        self.encoding = encoding
+        self.start = None
+        self.stream = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.stream is not None:
+            await self.send({
+                "type": "http.response.body",
+                "body": self.stream.feed(body, last=not more_body),
+                "more_body": more_body,
+            })
+            return
+
+        # Первая часть тела: решаем, сжимать ли ответ
+        headers = MutableHeaders(raw=self.start["headers"])
+        if "content-encoding" in headers or (not more_body and len(body) < self.compressor.minimum_size):
+            self.passthrough = True
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if more_body:
+            del headers["Content-Length"]
+            self.stream = self.compressor.stream(self.encoding)
+            body = self.stream.feed(body, last=False)
+        else:
+            body = self.compressor.compress(body, self.encoding)
+            headers["Content-Length"] = str(len(body))
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -11,6 +11,65 @@ class Settings(BaseSettings):
     postgres_db: str
     scheduler_interval_minutes: int = 15  # Default to 15 minutes if not specified
 
+    # Адаптивный опрос станций: интервал подстраивается под период отправки данных каждой станцией
+    scheduler_min_interval_seconds: int = 120
+    scheduler_max_interval_minutes: int = 60
+    scheduler_jitter_fraction: float = 0.1
+
+    # Пул соединений (отдельно для синхронного и асинхронного движков)
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_pre_ping: bool = True
+    db_pool_recycle_seconds: int = 1800
+    db_statement_timeout_ms: int = 10000  # Асинхронный движок эндпоинтов чтения API
+    # Синхронный движок: запись измерений, агрегаты, обслуживание секций; 0 - без ограничения
+    db_sync_statement_timeout_ms: int = 0
+    # Число запросов к базе в заголовке X-DB-Queries каждого ответа (для нагрузочных тестов)
+    db_query_count_header: bool = False
+
+    # Загрузка измерений со станций
+    upstream_base_url: str = "https://www.meteo.co.me/Hidrologija"  # Для бенчмарков - локальный сервер
+    ingest_concurrency: int = 8  # Одновременно обрабатываемых станций
+    ingest_requests_per_second: float = 5.0  # Лимит запросов на один хост
+    ingest_timeout_seconds: float = 30.0
+    ingest_retries: int = 3
+    ingest_backoff_seconds: float = 1.0  # Базовая задержка, удваивается с каждой попыткой
+
+    # Конвейер полного обновления: загрузка -> разбор (процессы) -> пакетная запись
+    ingest_fetch_workers: int = 0  # 0 - как ingest_concurrency
+    ingest_parse_workers: int = 0  # Процессов разбора, 0 - по числу ядер
+    ingest_write_workers: int = 1
+    ingest_queue_size: int = 32  # Ёмкость очередей между стадиями
+    ingest_write_batch_stations: int = 16  # Станций в одной транзакции записи
+
+    # Спул загруженных страниц на диске (пустая строка отключает)
+    ingest_spool_dir: str = "spool"
+    ingest_spool_fsync: bool = True
+    ingest_spool_retention_days: int = 14
+    ingest_spool_replay_after_seconds: int = 600  # Неотмеченные страницы старше этого переигрывает планировщик
+    ingest_spool_replay_batch: int = 1000  # Записей спула в одном прогоне переигровки
+
+    # Кэш метаданных станций в API
+    station_cache_ttl_seconds: int = 60
+
+    # Кэш ответов API: memory (LRU в процессе) или redis
+    response_cache_backend: str = "memory"
+    response_cache_max_entries: int = 2048
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+    response_cache_url: Optional[str] = None  # Например redis://localhost:6379/0
+    response_cache_ttl_seconds: int = 3600  # Для внешнего хранилища
+
+    # Прореживание рядов (max_points): сколько исходных точек читается не более
+    downsample_max_source_rows: int = 2_000_000
+
+    # Потоковая выгрузка: строк на одну порцию серверного курсора
+    export_chunk_rows: int = 5000
+
+    # Сжатие ответов (gzip, brotli при установленном пакете Brotli)
+    compression_min_bytes: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 5
+
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -21,4 +80,8 @@ def get_settings() -> Settings:
     return Settings()
 
 
-settings = get_settings() 
\ No newline at end of file
+def __getattr__(name):
+    # settings создаётся при первом обращении, а не при импорте модуля
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,10 +1,175 @@
+from sqlalchemy import func, select, text, tuple_
 from sqlalchemy.orm import Session
 from datetime import datetime
 from . import models, schemas
+from .station_cache import station_cache
+
+# Построители запросов общие для синхронного (crud) и асинхронного (crud_async) доступа
+
+def station_freshness_statement(station_id: int):
+    return select(models.Station.last_updated).where(models.Station.id == station_id)
+
+def network_freshness_statement():
+    # Меняется после каждого цикла загрузки, в котором появились новые данные
+    return select(func.max(models.Station.last_updated), func.count(models.Station.id))
+
+def _latest_lateral(table, alias):
+    return f"""
+    LEFT JOIN LATERAL (
+        SELECT timestamp_utc, value FROM {table}
+        WHERE station_id = s.id
+        ORDER BY timestamp_utc DESC
+        LIMIT 1
+    ) {alias} ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT value FROM {table}
+        WHERE station_id = s.id AND timestamp_utc <= {alias}.timestamp_utc - INTERVAL '24 hours'
+        ORDER BY timestamp_utc DESC
+        LIMIT 1
+    ) {alias}_prev ON TRUE"""
+
+# Последние значения всех станций и значения на 24 часа раньше - одним запросом,
+# каждый LATERAL читает одну строку по индексу (station_id, timestamp_utc)
+LATEST_READINGS_SQL = f"""
+    SELECT s.id AS station_id,
+           wl.timestamp_utc AS water_level_timestamp,
+           wl.value AS water_level,
+           wl_prev.value AS water_level_24h_ago,
+           t.timestamp_utc AS temperature_timestamp,
+           t.value AS temperature,
+           t_prev.value AS temperature_24h_ago
+    FROM stations s
+    {_latest_lateral("water_levels", "wl")}
+    {_latest_lateral("temperatures", "t")}
+    ORDER BY s.id
+"""
+
+def latest_readings_statement():
+    return text(LATEST_READINGS_SQL)
+
+def series_statement(
+    model,
+    station_id: int,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    skip: int = 0,
+    limit: int = 1000,
+    after: tuple = None
+):
+    stmt = select(model).where(model.station_id == station_id)
+    
+    if start_date:
+        stmt = stmt.where(model.timestamp_utc >= start_date)
+    if end_date:
+        stmt = stmt.where(model.timestamp_utc <= end_date)
+    
+    if after:
+        # Keyset-пагинация: продолжаем после строки (timestamp_utc, id) из курсора, без OFFSET
+        stmt = stmt.where(tuple_(model.timestamp_utc, model.id) > after)
+    elif skip:
+        stmt = stmt.offset(skip)
+    
+    return stmt.order_by(model.timestamp_utc.asc(), model.id.asc()).limit(limit)
+
+METRIC_MODELS = {
+    schemas.Metric.water_level: models.WaterLevel,
+    schemas.Metric.temperature: models.Temperature,
+}
+
+def aligned_series_statement(
+    station_id: int,
+    metrics,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    skip: int = 0,
+    limit: int = 1000,
+    after: datetime = None
+):
+    """Metrics of one station joined on timestamp_utc (FULL OUTER JOIN), one column per metric
+
+    Каждый подзапрос читает по индексу (station_id, timestamp_utc) не больше skip + limit первых строк:
+    первые N точек объединённого ряда всегда входят в первые N точек своих метрик, поэтому
+    соединяются и сортируются только эти строки, а не вся история станции.
+    """
+    rows_needed = None if limit is None else (0 if after else skip) + limit
+    subqueries = []
+    # Только запрошенные метрики, без повторов
+    for metric in dict.fromkeys(metrics):
+        model = METRIC_MODELS[metric]
+        stmt = select(model.timestamp_utc.label("timestamp_utc"), model.value.label(metric.value)).where(
+            model.station_id == station_id
+        )
+        if start_date:
+            stmt = stmt.where(model.timestamp_utc >= start_date)
+        if end_date:
+            stmt = stmt.where(model.timestamp_utc <= end_date)
+        if after:
+            # Курсор применяется внутри каждого подзапроса, чтобы он использовал индекс
+            stmt = stmt.where(model.timestamp_utc > after)
+        stmt = stmt.order_by(model.timestamp_utc.asc())
+        if rows_needed is not None:
+            stmt = stmt.limit(rows_needed)
+        subqueries.append(stmt.subquery(metric.value))
+    
+    joined = subqueries[0]
+    timestamp = subqueries[0].c.timestamp_utc
+    for subquery in subqueries[1:]:
+        joined = joined.outerjoin(subquery, subquery.c.timestamp_utc == timestamp, full=True)
+        timestamp = func.coalesce(timestamp, subquery.c.timestamp_utc)
+    
+    stmt = (
+        select(timestamp.label("timestamp_utc"), *[subquery.c[subquery.name] for subquery in subqueries])
+        .select_from(joined)
+        .order_by(timestamp.asc())
+        .limit(limit)
+    )
+    if skip and not after:
+        stmt = stmt.offset(skip)
+    return stmt
+
+def series_points_statement(
+    model,
+    station_id: int,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    limit: int = None
+):
+    """(timestamp_utc, value) tuples of the whole range, without ORM objects"""
+    stmt = select(model.timestamp_utc, model.value).where(model.station_id == station_id)
+    if start_date:
+        stmt = stmt.where(model.timestamp_utc >= start_date)
+    if end_date:
+        stmt = stmt.where(model.timestamp_utc <= end_date)
+    return stmt.order_by(model.timestamp_utc.asc()).limit(limit)
+
+def aggregates_statement(
+    station_id: int,
+    resolution: schemas.Resolution,
+    metric: schemas.Metric = None,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    skip: int = 0,
+    limit: int = 1000
+):
+    model = models.HourlyRollup if resolution == schemas.Resolution.hour else models.DailyRollup
+    stmt = select(model).where(model.station_id == station_id)
+    
+    if metric:
+        stmt = stmt.where(model.metric == metric.value)
+    if start_date:
+        stmt = stmt.where(model.bucket >= start_date)
+    if end_date:
+        stmt = stmt.where(model.bucket <= end_date)
+    
+    return stmt.order_by(model.bucket.asc(), model.metric.asc()).offset(skip).limit(limit)
 
 def get_station(db: Session, station_id: int):
     return db.query(models.Station).filter(models.Station.id == station_id).first()
 
+def get_station_freshness(db: Session, station_id: int):
+    """Station's last_updated as a single primary key lookup, None if the station does not exist"""
+    return db.execute(station_freshness_statement(station_id)).first()
+
 def get_stations(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Station).offset(skip).limit(limit).all()
 
@@ -21,6 +186,7 @@ def create_station(db: Session, station: schemas.StationCreate):
     db.add(db_station)
     db.commit()
     db.refresh(db_station)
+    station_cache.invalidate()
     return db_station
 
 def get_water_levels(
@@ -29,22 +195,11 @@ def get_water_levels(
     start_date: datetime = None,
     end_date: datetime = None,
     skip: int = 0,
-    limit: int = 1000
+    limit: int = 1000,
+    after: tuple = None
 ):
-    query = db.query(models.WaterLevel).filter(models.WaterLevel.station_id == station_id)
-    
-    if start_date:
-        query = query.filter(models.WaterLevel.timestamp_utc >= start_date)
-    if end_date:
-        query = query.filter(models.WaterLevel.timestamp_utc <= end_date)
-    
-    water_levels = query.order_by(models.WaterLevel.timestamp_utc.asc()).offset(skip).limit(limit).all()
-    
-    # Загружаем информацию о станции
-    for level in water_levels:
-        level.station = get_station(db, station_id)
-    
-    return water_levels
+    stmt = series_statement(models.WaterLevel, station_id, start_date, end_date, skip, limit, after)
+    return db.execute(stmt).scalars().all()
 
 def get_temperatures(
     db: Session,
@@ -52,19 +207,21 @@ def get_temperatures(
     start_date: datetime = None,
     end_date: datetime = None,
     skip: int = 0,
+    limit: int = 1000,
+    after: tuple = None
+):
+    stmt = series_statement(models.Temperature, station_id, start_date, end_date, skip, limit, after)
+    return db.execute(stmt).scalars().all()
+
+def get_aggregates(
+    db: Session,
+    station_id: int,
+    resolution: schemas.Resolution,
+    metric: schemas.Metric = None,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    skip: int = 0,
     limit: int = 1000
 ):
-    query = db.query(models.Temperature).filter(models.Temperature.station_id == station_id)
-    
-    if start_date:
-        query = query.filter(models.Temperature.timestamp_utc >= start_date)
-    if end_date:
-        query = query.filter(models.Temperature.timestamp_utc <= end_date)
-    
-    temperatures = query.order_by(models.Temperature.timestamp_utc.asc()).offset(skip).limit(limit).all()
-    
-    # Загружаем информацию о станции
-    for temp in temperatures:
-        temp.station = get_station(db, station_id)
-    
-    return temperatures 
\ No newline at end of file
+    stmt = aggregates_statement(station_id, resolution, metric, start_date, end_date, skip, limit)
+    return db.execute(stmt).scalars().all()
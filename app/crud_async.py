@@ -0,0 +1,110 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from . import models, schemas
+from .crud import (
+    aggregates_statement, aligned_series_statement, latest_readings_statement, network_freshness_statement,
+    series_points_statement, series_statement, station_freshness_statement
+)
+
+# Асинхронные версии функций чтения из crud для эндпоинтов API
+
+async def get_station_freshness(db: AsyncSession, station_id: int):
+    """Station's last_updated as a single primary key lookup, None if the station does not exist"""
+    return (await db.execute(station_freshness_statement(station_id))).first()
+
+async def get_network_freshness(db: AsyncSession):
+    """(max last_updated, station count) over all stations"""
+    return tuple((await db.execute(network_freshness_statement())).one())
+
+async def get_latest_readings(db: AsyncSession):
+    return (await db.execute(latest_readings_statement())).mappings().all()
+
+async def get_water_levels(
+    db: AsyncSession,
+    station_id: int,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    skip: int = 0,
+    limit: int = 1000,
+    after: tuple = None
+):
+    stmt = series_statement(models.WaterLevel, station_id, start_date, end_date, skip, limit, after)
+    return (await db.execute(stmt)).scalars().all()
+
+async def get_temperatures(
+    db: AsyncSession,
+    station_id: int,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    skip: int = 0,
+    limit: int = 1000,
+    after: tuple = None
+):
+    stmt = series_statement(models.Temperature, station_id, start_date, end_date, skip, limit, after)
+    return (await db.execute(stmt)).scalars().all()
+
+async def get_series_rows(
+    db: AsyncSession,
+    model,
+    station_id: int,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    skip: int = 0,
+    limit: int = 1000,
+    after: tuple = None
+):
+    """Same page as get_water_levels / get_temperatures as (timestamp_utc, value, id) tuples"""
+    stmt = series_statement(model, station_id, start_date, end_date, skip, limit, after)
+    stmt = stmt.with_only_columns(model.timestamp_utc, model.value, model.id)
+    return (await db.execute(stmt)).all()
+
+async def get_aggregates(
+    db: AsyncSession,
+    station_id: int,
+    resolution: schemas.Resolution,
+    metric: schemas.Metric = None,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    skip: int = 0,
+    limit: int = 1000
+):
+    stmt = aggregates_statement(station_id, resolution, metric, start_date, end_date, skip, limit)
+    return (await db.execute(stmt)).scalars().all()
+
+async def get_aligned_series(
+    db: AsyncSession,
+    station_id: int,
+    metrics,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    skip: int = 0,
+    limit: int = 1000,
+    after: datetime = None
+):
+    stmt = aligned_series_statement(station_id, metrics, start_date, end_date, skip, limit, after)
+    return (await db.execute(stmt)).mappings().all()
+
+async def get_series_points(
+    db: AsyncSession,
+    model,
+    station_id: int,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    limit: int = None
+):
+    stmt = series_points_statement(model, station_id, start_date, end_date, limit)
+    return (await db.execute(stmt)).all()
+
+async def stream_aligned_series(
+    db: AsyncSession,
+    station_id: int,
+    metrics,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    chunk_rows: int = 5000
+):
+    """Yield lists of aligned rows as tuples from a server-side cursor"""
+    stmt = aligned_series_statement(station_id, metrics, start_date, end_date, limit=None)
+    result = await db.stream(stmt.execution_options(yield_per=chunk_rows))
+    async for partition in result.partitions():
+        yield partition
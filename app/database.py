@@ -1,11 +1,82 @@
+from functools import lru_cache
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from app.config import settings
+from app.config import get_settings
+
+# Движки и фабрики сессий создаются при первом обращении (database.engine, database.SessionLocal и т.д.),
+# поэтому импорт модуля не читает настройки и не требует доступной базы
+
+
+def database_url(driver: str = "postgresql") -> str:
+    settings = get_settings()
+    return f"{driver}://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}:{settings.postgres_port}/{settings.postgres_db}"
+
+
+def pool_options() -> dict:
+    settings = get_settings()
+    return dict(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_recycle=settings.db_pool_recycle_seconds,
+    )
+
+
+@lru_cache()
+def get_engine():
+    # Загрузка, пересчёт агрегатов и обслуживание секций выполняют долгие запросы,
+    # поэтому таймаут API к синхронному движку не применяется
+    timeout_ms = get_settings().db_sync_statement_timeout_ms
+    engine = create_engine(
+        database_url(),
+        connect_args={"options": f"-c statement_timeout={timeout_ms}"} if timeout_ms else {},
+        **pool_options()
+    )
+    if get_settings().db_query_count_header:
+        from app.query_stats import instrument
+        instrument(engine)
+    return engine
+
+
+@lru_cache()
+def get_session_factory():
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+
+# Асинхронный движок для эндпоинтов чтения API
+@lru_cache()
+def get_async_engine():
+    engine = create_async_engine(
+        database_url("postgresql+asyncpg"),
+        connect_args={"server_settings": {"statement_timeout": str(get_settings().db_statement_timeout_ms)}},
+        **pool_options()
+    )
+    if get_settings().db_query_count_header:
+        from app.query_stats import instrument
+        instrument(engine.sync_engine)
+    return engine
+
+
+@lru_cache()
+def get_async_session_factory():
+    return async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+
+
+_LAZY_ATTRIBUTES = {
+    "engine": get_engine,
+    "SessionLocal": get_session_factory,
+    "async_engine": get_async_engine,
+    "AsyncSessionLocal": get_async_session_factory,
+}
+
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}:{settings.postgres_port}/{settings.postgres_db}"
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base() 
\ No newline at end of file
+Base = declarative_base()
@@ -0,0 +1,80 @@
+import numpy as np
+
+# Методы прореживания рядов для графиков
+LTTB = "lttb"
+MINMAX = "minmax"
+
+
+def minmax(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of the min and max point of each bucket, in time order
+
+    Каждый интервал даёт не более двух точек, поэтому пики и провалы сохраняются всегда.
+    """
+    n = len(x)
+    if n <= max_points or max_points < 2:
+        return np.arange(n)
+
+    buckets = max(max_points // 2, 1)
+    # Равные по числу точек интервалы; границы - начала интервалов
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)[:-1]
+    bucket_of = np.repeat(np.arange(buckets), np.diff(np.append(edges, n)))
+
+    # Сортировка внутри интервала по значению: первый элемент - минимум, последний - максимум
+    order = np.lexsort((y, bucket_of))
+    ends = np.append(edges[1:], n) - 1
+    indices = np.concatenate((order[edges], order[ends]))
+    return np.unique(indices)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices selected by Largest-Triangle-Three-Buckets
+
+    Цикл идёт по интервалам (не более max_points итераций), площади треугольников
+    внутри интервала считаются векторно.
+    """
+    n = len(x)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # Первая и последняя точки всегда сохраняются, остальные max_points - 2 интервала
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    # Средние точки следующих интервалов считаются заранее для всех интервалов сразу
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[n - 1])
+    avg_y = np.append(sums_y / counts, y[n - 1])
+
+    selected = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_x, next_y = avg_x[bucket + 1], avg_y[bucket + 1]
+        area = np.abs(
+            (x[selected] - next_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (next_y - y[selected])
+        )
+        selected = start + int(np.argmax(area))
+        indices[bucket + 1] = selected
+    return indices
+
+
+METHODS = {
+    LTTB: lttb,
+    MINMAX: minmax,
+}
+
+
+def effective_method(method: str, max_points: int) -> str:
+    """Method actually applied: LTTB needs first, last and at least one bucket, smaller targets use minmax"""
+    return MINMAX if method == LTTB and max_points < 3 else method
+
+
+def downsample(x: np.ndarray, y: np.ndarray, max_points: int, method: str = MINMAX) -> np.ndarray:
+    """Indices of the points to keep, x must be sorted"""
+    return METHODS[effective_method(method, max_points)](x, y, max_points)
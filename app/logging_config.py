@@ -8,6 +8,9 @@ def setup_logging(service_name):
     
     # Create logger
     logger = logging.getLogger(service_name)
+    # Модули одного сервиса вызывают setup_logging каждый - обработчики добавляются один раз
+    if logger.handlers:
+        return logger
     logger.setLevel(logging.INFO)
     
     # Create formatters
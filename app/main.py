@@ -1,12 +1,24 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from typing import List
-from . import crud, models, schemas
-from .database import SessionLocal, engine
+import math
+from functools import lru_cache
+from typing import List, Optional
+from . import crud, crud_async, database, fast_json, models, schemas, series_formats
+from .compression import CompressionMiddleware, Compressor
+from .config import get_settings
+from .pagination import decode_cursor, encode_cursor
+from .query_stats import QUERY_COUNT_HEADER, QueryCountMiddleware
+from .series_formats import epoch_ms
+from .response_cache import CacheEntry, ResponseCache, create_backend
+from .station_cache import station_cache
 
-models.Base.metadata.create_all(bind=engine)
+# Схема создаётся отдельным шагом (scripts/init_db.py и migrations/): импорт приложения не обращается к базе,
+# настройки, движки и numpy загружаются при первом использовании
 
 app = FastAPI()
 
@@ -17,84 +29,395 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Downsample-Method", "X-Downsample-Truncated-At", "ETag", QUERY_COUNT_HEADER],
 )
 
+# Счётчик запросов к базе (DB_QUERY_COUNT_HEADER); включается настройкой, читаемой при первом запросе
+app.add_middleware(QueryCountMiddleware, enabled=lambda: get_settings().db_query_count_header)
+
+@lru_cache()
+def get_compressor():
+    settings = get_settings()
+    return Compressor(
+        minimum_size=settings.compression_min_bytes,
+        gzip_level=settings.compression_gzip_level,
+        brotli_quality=settings.compression_brotli_quality
+    )
+
+@lru_cache()
+def get_response_cache():
+    return ResponseCache(create_backend(get_settings()), get_compressor())
+
+# Добавлен после CORS, поэтому выполняется первым и сжимает уже окончательный ответ
+app.add_middleware(CompressionMiddleware, get_compressor=get_compressor)
+
 # Dependency
 def get_db():
-    db = SessionLocal()
+    db = database.SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+async def get_async_db():
+    async with database.AsyncSessionLocal() as db:
+        yield db
+
+def parse_cursor(cursor: str):
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def parse_metrics(metrics: str):
+    """Comma separated metric names, duplicates removed, order kept"""
+    parsed = []
+    for name in metrics.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        try:
+            metric = schemas.Metric(name)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Unknown metric: {name}")
+        if metric not in parsed:
+            parsed.append(metric)
+    if not parsed:
+        raise HTTPException(status_code=400, detail="No metrics requested")
+    return parsed
+
+def next_cursor_headers(rows, limit: int):
+    """Pass the cursor of the next page in X-Next-Cursor when the page is full"""
+    if limit and len(rows) == limit:
+        last = rows[-1]
+        return {"X-Next-Cursor": encode_cursor(last.timestamp_utc, last.id)}
+    return {}
+
+def downsample_points(points, max_points: int, method: schemas.DownsampleMethod):
+    """Reduce (timestamp_utc, value) points to max_points, returns (points, method or None if not reduced)"""
+    if len(points) <= max_points:
+        return points, None
+    import numpy as np
+    from .downsample import downsample as downsample_indices, effective_method
+    
+    method = schemas.DownsampleMethod(effective_method(method.value, max_points))
+    timestamps, values = zip(*points)
+    keep = downsample_indices(epoch_ms(timestamps), np.array(values, dtype=np.float64), max_points, method.value)
+    return [points[i] for i in keep.tolist()], method
+
+def downsample_aligned(rows, metrics, max_points: int, method: schemas.DownsampleMethod):
+    """Downsample each metric of aligned rows separately and keep the union of selected rows"""
+    if len(rows) <= max_points:
+        return rows, None
+    import numpy as np
+    from .downsample import downsample as downsample_indices, effective_method
+    
+    method = schemas.DownsampleMethod(effective_method(method.value, max_points))
+    timestamps = epoch_ms([row["timestamp_utc"] for row in rows])
+    keep = []
+    for metric in metrics:
+        values = np.array([row[metric.value] for row in rows], dtype=np.float64)  # None -> NaN
+        present = np.flatnonzero(~np.isnan(values))
+        selected = downsample_indices(timestamps[present], values[present], max_points, method.value)
+        keep.append(present[selected])
+    return [rows[i] for i in np.unique(np.concatenate(keep)).tolist()], method
+
+def downsample_headers(method, truncated_at=None):
+    """Method applied and, if the source read hit downsample_max_source_rows, the last source timestamp read"""
+    headers = {"X-Downsample-Method": method.value if method else "none"}
+    if truncated_at is not None:
+        headers["X-Downsample-Truncated-At"] = truncated_at.isoformat()
+    return headers
+
+def source_truncated_at(count: int, last_timestamp):
+    """Timestamp where the downsampling source read was cut, None if the whole range was read"""
+    return last_timestamp if count and count >= get_settings().downsample_max_source_rows else None
+
+# Ответы рядов зависят от Accept (см. series_formats)
+VARY_ACCEPT = {"Vary": "Accept"}
+
+def measurements_entry(media_type: str, station_id: int, rows, headers):
+    """Water level / temperature list from (timestamp_utc, value, ...) rows in the negotiated format"""
+    if media_type != series_formats.JSON:
+        return series_formats.columns_entry(
+            media_type, [row[0] for row in rows], {"v": [row[1] for row in rows]}, headers
+        )
+    # Быстрый путь: кортежи кодируются orjson напрямую, схема в OpenAPI по-прежнему из response_model
+    body = fast_json.records(rows, ("timestamp", "value"), station_id=station_id)
+    return CacheEntry.build(body, headers=dict(headers, **VARY_ACCEPT))
+
+def json_entry(payload, headers=None):
+    """Serialize payload the same way FastAPI's default JSONResponse does"""
+    return CacheEntry.build(JSONResponse(content=jsonable_encoder(payload)).body, headers=headers)
+
+async def station_version(db: AsyncSession, station_id: int):
+    """Freshness version of the station's data; 404 if the station does not exist"""
+    station = await crud_async.get_station_freshness(db, station_id)
+    if station is None:
+        raise HTTPException(status_code=404, detail="Station not found")
+    return station.last_updated
+
+@app.get("/health")
+def health():
+    """Liveness check that does not touch the database"""
+    return {"status": "ok"}
+
 @app.get("/stations/", response_model=List[schemas.Station])
-def read_stations(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    stations = crud.get_stations(db, skip=skip, limit=limit)
-    return stations
+def read_stations(request: Request, skip: int = 0, limit: int = 100):
+    # Версия - (max(last_updated), count) таблицы, как у /stations/latest: одинакова во всех воркерах
+    version, stations = station_cache.snapshot()
+    return get_response_cache().respond(
+        request,
+        version,
+        lambda: json_entry([schemas.Station.model_validate(station) for station in stations[skip:skip + limit]])
+    )
+
+# Объявлен до /stations/{station_id}, иначе "latest" разбирался бы как station_id
+@app.get("/stations/latest", response_model=List[schemas.LatestReading])
+async def read_latest_readings(request: Request, db: AsyncSession = Depends(get_async_db)):
+    async def build():
+        readings = await crud_async.get_latest_readings(db)
+        return json_entry([schemas.LatestReading(**reading) for reading in readings])
+    
+    # Ответ кэшируется до следующего цикла загрузки, изменяющего last_updated станций
+    return await get_response_cache().arespond(request, await crud_async.get_network_freshness(db), build)
 
 @app.get("/stations/{station_id}", response_model=schemas.Station)
-def read_station(station_id: int, db: Session = Depends(get_db)):
-    db_station = crud.get_station(db, station_id=station_id)
+def read_station(station_id: int, request: Request):
+    db_station = station_cache.get(station_id)
     if db_station is None:
         raise HTTPException(status_code=404, detail="Station not found")
-    return db_station
+    # last_updated самой станции меняется и при изменении её описания (см. fill_stations_table)
+    return get_response_cache().respond(
+        request,
+        db_station.last_updated,
+        lambda: json_entry(schemas.Station.model_validate(db_station))
+    )
 
 @app.post("/stations/", response_model=schemas.Station)
 def create_station(station: schemas.StationCreate, db: Session = Depends(get_db)):
     return crud.create_station(db=db, station=station)
 
-@app.get("/stations/{station_id}/water-levels/", response_model=List[schemas.WaterLevel])
-def read_water_levels(
+@app.get("/stations/{station_id}/water-levels/", response_model=List[schemas.WaterLevel], responses=series_formats.OPENAPI_RESPONSES)
+async def read_water_levels(
     station_id: int,
+    request: Request,
     start_date: datetime = None,
     end_date: datetime = None,
     skip: int = 0,
     limit: int = 1000,
-    db: Session = Depends(get_db)
+    cursor: str = None,
+    max_points: Optional[int] = Query(None, ge=2, description="Reduce the whole date range to at most this many points; paging parameters are ignored"),
+    downsample: schemas.DownsampleMethod = schemas.DownsampleMethod.minmax,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if crud.get_station(db, station_id=station_id) is None:
-        raise HTTPException(status_code=404, detail="Station not found")
-    water_levels = crud.get_water_levels(
-        db,
-        station_id=station_id,
-        start_date=start_date,
-        end_date=end_date,
-        skip=skip,
-        limit=limit
-    )
-    return [
-        schemas.WaterLevel(
-            station_id=level.station_id,
-            timestamp=level.timestamp_utc,
-            value=level.value
+    media_type = series_formats.negotiate(request)
+    after = parse_cursor(cursor)
+    
+    async def build():
+        if max_points:
+            points = await crud_async.get_series_points(
+                db, models.WaterLevel, station_id, start_date, end_date, get_settings().downsample_max_source_rows
+            )
+            truncated_at = source_truncated_at(len(points), points[-1][0] if points else None)
+            points, method = downsample_points(points, max_points, downsample)
+            return measurements_entry(media_type, station_id, points, downsample_headers(method, truncated_at))
+        
+        rows = await crud_async.get_series_rows(
+            db, models.WaterLevel, station_id, start_date, end_date, skip, limit, after
         )
-        for level in water_levels
-    ]
+        return measurements_entry(media_type, station_id, rows, next_cursor_headers(rows, limit))
+    
+    return await get_response_cache().arespond(request, await station_version(db, station_id), build, media_type)
 
-@app.get("/stations/{station_id}/temperatures/", response_model=List[schemas.Temperature])
-def read_temperatures(
+@app.get("/stations/{station_id}/temperatures/", response_model=List[schemas.Temperature], responses=series_formats.OPENAPI_RESPONSES)
+async def read_temperatures(
     station_id: int,
+    request: Request,
     start_date: datetime = None,
     end_date: datetime = None,
     skip: int = 0,
     limit: int = 1000,
-    db: Session = Depends(get_db)
+    cursor: str = None,
+    max_points: Optional[int] = Query(None, ge=2, description="Reduce the whole date range to at most this many points; paging parameters are ignored"),
+    downsample: schemas.DownsampleMethod = schemas.DownsampleMethod.minmax,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if crud.get_station(db, station_id=station_id) is None:
-        raise HTTPException(status_code=404, detail="Station not found")
-    temperatures = crud.get_temperatures(
-        db,
-        station_id=station_id,
-        start_date=start_date,
-        end_date=end_date,
-        skip=skip,
-        limit=limit
-    )
-    return [
-        schemas.Temperature(
-            station_id=temp.station_id,
-            timestamp=temp.timestamp_utc,
-            value=temp.value
+    media_type = series_formats.negotiate(request)
+    after = parse_cursor(cursor)
+    
+    async def build():
+        if max_points:
+            points = await crud_async.get_series_points(
+                db, models.Temperature, station_id, start_date, end_date, get_settings().downsample_max_source_rows
+            )
+            truncated_at = source_truncated_at(len(points), points[-1][0] if points else None)
+            points, method = downsample_points(points, max_points, downsample)
+            return measurements_entry(media_type, station_id, points, downsample_headers(method, truncated_at))
+        
+        rows = await crud_async.get_series_rows(
+            db, models.Temperature, station_id, start_date, end_date, skip, limit, after
+        )
+        return measurements_entry(media_type, station_id, rows, next_cursor_headers(rows, limit))
+    
+    return await get_response_cache().arespond(request, await station_version(db, station_id), build, media_type)
+
+@app.get("/stations/{station_id}/aggregates/", response_model=List[schemas.Aggregate])
+async def read_aggregates(
+    station_id: int,
+    request: Request,
+    resolution: schemas.Resolution = schemas.Resolution.hour,
+    metric: schemas.Metric = None,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    skip: int = 0,
+    limit: int = 1000,
+    db: AsyncSession = Depends(get_async_db)
+):
+    async def build():
+        aggregates = await crud_async.get_aggregates(
+            db,
+            station_id=station_id,
+            resolution=resolution,
+            metric=metric,
+            start_date=start_date,
+            end_date=end_date,
+            skip=skip,
+            limit=limit
         )
-        for temp in temperatures
-    ] 
\ No newline at end of file
+        return json_entry([
+            schemas.Aggregate(
+                station_id=row.station_id,
+                metric=row.metric,
+                timestamp=row.bucket,
+                min=row.min_value,
+                max=row.max_value,
+                avg=row.avg_value,
+                count=row.count,
+                last=row.last_value
+            )
+            for row in aggregates
+        ])
+    
+    return await get_response_cache().arespond(request, await station_version(db, station_id), build)
+
+@app.get("/stations/{station_id}/series", response_model=schemas.Series, responses=series_formats.OPENAPI_RESPONSES)
+async def read_series(
+    station_id: int,
+    request: Request,
+    metrics: str = "water_level,temperature",
+    start_date: datetime = None,
+    end_date: datetime = None,
+    skip: int = 0,
+    limit: int = 1000,
+    cursor: str = None,
+    max_points: Optional[int] = Query(None, ge=2, description="Reduce the whole date range to at most this many points per metric; paging parameters are ignored"),
+    downsample: schemas.DownsampleMethod = schemas.DownsampleMethod.minmax,
+    db: AsyncSession = Depends(get_async_db)
+):
+    requested = parse_metrics(metrics)
+    media_type = series_formats.negotiate(request)
+    after = parse_cursor(cursor)
+    
+    async def build():
+        rows = await crud_async.get_aligned_series(
+            db,
+            station_id=station_id,
+            metrics=requested,
+            start_date=start_date,
+            end_date=end_date,
+            skip=0 if max_points else skip,
+            limit=get_settings().downsample_max_source_rows if max_points else limit,
+            after=None if max_points else (after[0] if after else None)
+        )
+        method = None
+        next_cursor = None
+        truncated_at = None
+        if max_points:
+            truncated_at = source_truncated_at(len(rows), rows[-1]["timestamp_utc"] if rows else None)
+            rows, method = downsample_aligned(rows, requested, max_points, downsample)
+        elif limit and len(rows) == limit:
+            # Выровненные точки уникальны по timestamp_utc, id в курсоре не нужен
+            next_cursor = encode_cursor(rows[-1]["timestamp_utc"], 0)
+        if media_type != series_formats.JSON:
+            # Курсор и метод прореживания в столбцовых форматах передаются заголовками
+            headers = downsample_headers(method, truncated_at)
+            if next_cursor:
+                headers["X-Next-Cursor"] = next_cursor
+            return series_formats.columns_entry(
+                media_type,
+                [row["timestamp_utc"] for row in rows],
+                {metric.value: [row[metric.value] for row in rows] for metric in requested},
+                headers
+            )
+        return json_entry(schemas.Series(
+            station_id=station_id,
+            metrics=requested,
+            points=[
+                schemas.SeriesPoint(
+                    timestamp=row["timestamp_utc"],
+                    **{metric.value: row[metric.value] for metric in requested}
+                )
+                for row in rows
+            ],
+            next_cursor=next_cursor,
+            downsample=method
+        ), headers=dict(VARY_ACCEPT, **downsample_headers(method, truncated_at)) if truncated_at else VARY_ACCEPT)
+    
+    return await get_response_cache().arespond(request, await station_version(db, station_id), build, media_type)
+
+def format_value(value, null):
+    # NaN и бесконечности не являются числами ни в JSON, ни в CSV - пишутся как пропуск
+    return null if value is None or not math.isfinite(value) else repr(value)
+
+async def export_chunks(station_id: int, metrics, export_format: schemas.ExportFormat, start_date, end_date):
+    """Encode aligned rows straight to NDJSON / CSV bytes, chunk by chunk"""
+    names = [metric.value for metric in metrics]
+    if export_format == schemas.ExportFormat.csv:
+        yield (",".join(["timestamp", *names]) + "\n").encode()
+    
+    # Отдельная сессия: генератор работает дольше, чем зависимости эндпоинта
+    async with database.AsyncSessionLocal() as db:
+        async for rows in crud_async.stream_aligned_series(
+            db, station_id, metrics, start_date, end_date, get_settings().export_chunk_rows
+        ):
+            if export_format == schemas.ExportFormat.csv:
+                lines = [
+                    ",".join([row[0].isoformat(), *(format_value(value, "") for value in row[1:])])
+                    for row in rows
+                ]
+            else:
+                lines = [
+                    '{"timestamp":"' + row[0].isoformat() + '",'
+                    + ",".join(f'"{name}":{format_value(value, "null")}' for name, value in zip(names, row[1:]))
+                    + "}"
+                    for row in rows
+                ]
+            yield ("\n".join(lines) + "\n").encode()
+
+@app.get("/stations/{station_id}/export")
+async def export_series(
+    station_id: int,
+    format: schemas.ExportFormat = schemas.ExportFormat.ndjson,
+    metrics: str = "water_level,temperature",
+    start_date: datetime = None,
+    end_date: datetime = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    requested = parse_metrics(metrics)
+    await station_version(db, station_id)
+    
+    media_type = "text/csv" if format == schemas.ExportFormat.csv else "application/x-ndjson"
+    filename = f"station_{station_id}.{format.value}"
+    return StreamingResponse(
+        export_chunks(station_id, requested, format, start_date, end_date),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/stats/compression")
+def read_compression_stats():
+    """Bytes before/after and CPU seconds spent per content coding since the worker started"""
+    return get_compressor().stats.snapshot()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -17,18 +17,56 @@ class Station(Base):
 
 class WaterLevel(Base):
     __tablename__ = "water_levels"
+    # Секционирование по месяцам (см. app/partitions.py), поэтому timestamp_utc входит в ключи
+    __table_args__ = (
+        UniqueConstraint("station_id", "timestamp", "timestamp_utc", name="uq_water_levels_station_timestamp"),
+        Index("ix_water_levels_station_timestamp_utc", "station_id", "timestamp_utc"),
+        {"postgresql_partition_by": "RANGE (timestamp_utc)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     station_id = Column(Integer, ForeignKey("stations.id"))
     timestamp = Column(DateTime)
-    timestamp_utc = Column(DateTime)  # UTC timestamp
+    timestamp_utc = Column(DateTime, primary_key=True)  # UTC timestamp
     value = Column(Float)
 
 class Temperature(Base):
     __tablename__ = "temperatures"
+    # Секционирование по месяцам (см. app/partitions.py), поэтому timestamp_utc входит в ключи
+    __table_args__ = (
+        UniqueConstraint("station_id", "timestamp", "timestamp_utc", name="uq_temperatures_station_timestamp"),
+        Index("ix_temperatures_station_timestamp_utc", "station_id", "timestamp_utc"),
+        {"postgresql_partition_by": "RANGE (timestamp_utc)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     station_id = Column(Integer, ForeignKey("stations.id"))
     timestamp = Column(DateTime)
-    timestamp_utc = Column(DateTime)  # UTC timestamp
-    value = Column(Float) 
\ No newline at end of file
+    timestamp_utc = Column(DateTime, primary_key=True)  # UTC timestamp
+    value = Column(Float)
+
+class HourlyRollup(Base):
+    __tablename__ = "rollups_hourly"
+
+    station_id = Column(Integer, ForeignKey("stations.id"), primary_key=True)
+    metric = Column(String, primary_key=True)  # water_level / temperature
+    bucket = Column(DateTime, primary_key=True)  # Начало часа (UTC)
+    min_value = Column(Float)
+    max_value = Column(Float)
+    avg_value = Column(Float)
+    count = Column(Integer)
+    last_value = Column(Float)
+    last_timestamp = Column(DateTime)
+
+class DailyRollup(Base):
+    __tablename__ = "rollups_daily"
+
+    station_id = Column(Integer, ForeignKey("stations.id"), primary_key=True)
+    metric = Column(String, primary_key=True)  # water_level / temperature
+    bucket = Column(DateTime, primary_key=True)  # Начало суток (UTC)
+    min_value = Column(Float)
+    max_value = Column(Float)
+    avg_value = Column(Float)
+    count = Column(Integer)
+    last_value = Column(Float)
+    last_timestamp = Column(DateTime)
@@ -0,0 +1,19 @@
+import base64
+import binascii
+from datetime import datetime
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Opaque cursor pointing at the last returned row (timestamp_utc, id)"""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Decode a cursor into (timestamp_utc, id), raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
@@ -0,0 +1,132 @@
+from datetime import date, timedelta
+from sqlalchemy.sql import text
+
+# Таблицы измерений, секционированные по месяцам по timestamp_utc
+PARTITIONED_TABLES = ("water_levels", "temperatures")
+# Сколько будущих месяцев создавать заранее
+MONTHS_AHEAD = 2
+# Секции создаются и для окна полной загрузки станции (FULL_FETCH_DAYS в scripts/high_water.py),
+# иначе загрузка на границе месяца попадает в секцию DEFAULT
+BACKFILL_DAYS = 14
+# Секции старше этого числа месяцев получают BRIN-индекс по timestamp_utc
+BRIN_AFTER_MONTHS = 2
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def create_partition(conn, table, month):
+    """Create the monthly partition of table if it does not exist yet
+
+    Строки этого месяца, уже попавшие в секцию DEFAULT, переносятся в новую секцию: иначе PostgreSQL
+    отказывается создавать секцию. Таблица создаётся отдельно и присоединяется в той же транзакции.
+    """
+    name = partition_name(table, month)
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);"))
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": f"{table}_default"}).scalar() is not None:
+        conn.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {table}_default
+                WHERE timestamp_utc >= '{start}' AND timestamp_utc < '{end}'
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved;
+        """))
+    # Индексы и ограничения секционированной таблицы создаются на секции при присоединении
+    conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}');"))
+
+
+def create_partitions(conn, table, first_month, last_month):
+    """Create monthly partitions covering first_month..last_month inclusive"""
+    month = month_start(first_month)
+    while month <= last_month:
+        create_partition(conn, table, month)
+        month = add_months(month, 1)
+
+
+def list_partitions(conn, table):
+    """Monthly partitions of table as (name, month) pairs, oldest first"""
+    rows = conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table
+    """), {"table": table}).scalars().all()
+
+    partitions = []
+    prefix = f"{table}_y"
+    for name in rows:
+        if not name.startswith(prefix):
+            continue  # секция DEFAULT
+        year, month = name[len(prefix):].split("m")
+        partitions.append((name, date(int(year), int(month), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def brin_candidates(conn, table, today=None):
+    """Partitions that no longer receive new data"""
+    cutoff = add_months(month_start(today or date.today()), -BRIN_AFTER_MONTHS)
+    return [name for name, month in list_partitions(conn, table) if month < cutoff]
+
+
+def create_brin_index(conn, name):
+    conn.execute(text(f"""
+        CREATE INDEX IF NOT EXISTS {name}_brin_timestamp_utc
+        ON {name} USING brin (timestamp_utc);
+    """))
+
+
+def create_brin_indexes(conn, table, today=None):
+    """Add BRIN indexes on timestamp_utc to partitions that no longer receive new data"""
+    for name in brin_candidates(conn, table, today):
+        create_brin_index(conn, name)
+
+
+def detach_partition(conn, table, month):
+    """Detach a monthly partition; the data stays in a standalone table for archiving or DROP"""
+    conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition_name(table, month)};"))
+
+
+def maintain_partitions(engine, today=None):
+    """Create partitions from the backfill window to the coming months and BRIN indexes on old ones
+
+    Каждая секция и каждый индекс создаются в отдельной транзакции: ошибка одного шага не откатывает
+    остальные. Returns a list of (object name, exception) for the steps that failed.
+    """
+    today = today or date.today()
+    first = month_start(today - timedelta(days=BACKFILL_DAYS))
+    last = add_months(month_start(today), MONTHS_AHEAD)
+    failures = []
+    for table in PARTITIONED_TABLES:
+        month = first
+        while month <= last:
+            try:
+                with engine.begin() as conn:
+                    create_partition(conn, table, month)
+            except Exception as e:
+                failures.append((partition_name(table, month), e))
+            month = add_months(month, 1)
+
+        with engine.connect() as conn:
+            names = brin_candidates(conn, table, today)
+        for name in names:
+            try:
+                with engine.begin() as conn:
+                    create_brin_index(conn, name)
+            except Exception as e:
+                failures.append((f"{name}_brin_timestamp_utc", e))
+    return failures
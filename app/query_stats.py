@@ -0,0 +1,53 @@
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+QUERY_COUNT_HEADER = "X-DB-Queries"
+
+# Счётчик запросов к базе текущего HTTP-запроса; список, чтобы потоки threadpool видели тот же объект
+_query_count = ContextVar("query_count", default=None)
+
+
+def _on_execute(*args):
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def instrument(engine):
+    """Count statements of a sync engine (for an AsyncEngine pass engine.sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _on_execute)
+
+
+class QueryCountMiddleware:
+    """ASGI middleware reporting the number of DB statements of a request in the X-DB-Queries header
+
+    Запросы, выполненные после отправки заголовков (потоковая выгрузка), в заголовок не попадают.
+    """
+
+    def __init__(self, app, enabled):
+        """enabled - функция, возвращающая True, если счётчик включён; вызывается при первом запросе"""
+        self.app = app
+        self.enabled = enabled
+        self.active = None
+
+    async def __call__(self, scope, receive, send):
+        if self.active is None:
+            self.active = self.enabled()
+        if scope["type"] != "http" or not self.active:
+            await self.app(scope, receive, send)
+            return
+
+        counter = [0]
+        token = _query_count.set(counter)
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[QUERY_COUNT_HEADER] = str(counter[0])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _query_count.reset(token)
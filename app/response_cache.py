@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+from .compression import choose_encoding
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    media_type: str = "application/json"
+    headers: Dict[str, str] = field(default_factory=dict)
+    # Сжатые варианты тела по content coding, заполняются при первом запросе с таким Accept-Encoding
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(body) for body in self.encoded.values())
+
+    def encoded_etag(self, encoding: str) -> str:
+        """Strong ETag of a compressed representation, distinct from the identity one"""
+        return self.etag[:-1] + f'-{encoding}"'
+
+    @classmethod
+    def build(cls, body: bytes, media_type: str = "application/json", headers: Dict[str, str] = None):
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        return cls(body=body, etag=etag, media_type=media_type, headers=headers or {})
+
+    def to_bytes(self) -> bytes:
+        meta = json.dumps({
+            "etag": self.etag,
+            "media_type": self.media_type,
+            "headers": self.headers,
+            "encoded": {encoding: len(body) for encoding, body in self.encoded.items()},
+        })
+        return meta.encode() + b"\n" + b"".join(self.encoded.values()) + self.body
+
+    @classmethod
+    def from_bytes(cls, raw: bytes):
+        meta, body = raw.split(b"\n", 1)
+        meta = json.loads(meta)
+        # Сжатые варианты записаны перед исходным телом в порядке перечисления в meta
+        encoded = {}
+        offset = 0
+        for encoding, length in meta.get("encoded", {}).items():
+            encoded[encoding] = body[offset:offset + length]
+            offset += length
+        return cls(
+            body=body[offset:], etag=meta["etag"], media_type=meta["media_type"],
+            headers=meta["headers"], encoded=encoded
+        )
+
+
+class LRUBackend:
+    """In-process LRU limited by entry count and total body size"""
+
+    blocking = False
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry):
+        # Размер запоминается отдельно: запись может дополниться сжатыми вариантами и сохраниться повторно
+        size = entry.size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._size -= self._sizes.pop(key)
+            self._entries[key] = entry
+            self._sizes[key] = size
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                evicted_key, _ = self._entries.popitem(last=False)
+                self._size -= self._sizes.pop(evicted_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._size = 0
+
+
+class KeyValueBackend:
+    """External key-value store with a redis-like client (get(key), set(key, value, ex=seconds))
+
+    В тестах client можно заменить любым объектом с такими же методами.
+    """
+
+    # Обращения к клиенту блокирующие - в асинхронных эндпоинтах выполняются в потоке
+    blocking = True
+
+    def __init__(self, client, ttl_seconds: int, prefix: str = "waterlevel:response:"):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        raw = self.client.get(self.prefix + key)
+        return CacheEntry.from_bytes(raw) if raw is not None else None
+
+    def set(self, key: str, entry: CacheEntry):
+        self.client.set(self.prefix + key, entry.to_bytes(), ex=self.ttl_seconds)
+
+
+def create_backend(settings):
+    if settings.response_cache_backend == "redis":
+        import redis  # Необязательная зависимость, нужна только для внешнего кэша
+
+        client = redis.Redis.from_url(settings.response_cache_url)
+        return KeyValueBackend(client, settings.response_cache_ttl_seconds)
+    return LRUBackend(settings.response_cache_max_entries, settings.response_cache_max_bytes)
+
+
+def cache_key(request: Request, version, variant: str = "") -> str:
+    """Path, sorted query parameters, the freshness version of the underlying data and the negotiated variant"""
+    query = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{query}|{version}|{variant}"
+
+
+def etag_matches(request: Request, *etags: str) -> bool:
+    """Strong comparison against If-None-Match"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or any(etag in candidates for etag in etags)
+
+
+def response_encoding(request: Request, entry: CacheEntry, compressor) -> Optional[str]:
+    """Content coding to serve the entry with, None for the identity body"""
+    if compressor is None or len(entry.body) < compressor.minimum_size:
+        return None
+    return choose_encoding(request.headers.get("accept-encoding", ""))
+
+
+def to_response(request: Request, entry: CacheEntry, encoding: str = None, compressor=None, cached: bool = True) -> Response:
+    """Response for a cache entry; with encoding the precompressed body from entry.encoded is sent
+
+    cached=False - тело только что сжато и уже учтено в статистике compressor.
+    """
+    if encoding is None:
+        headers = dict(entry.headers, ETag=entry.etag)
+        if etag_matches(request, entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+    vary = ", ".join(filter(None, (entry.headers.get("Vary"), "Accept-Encoding")))
+    headers = dict(entry.headers, ETag=entry.encoded_etag(encoding), Vary=vary)
+    if etag_matches(request, entry.etag, entry.encoded_etag(encoding)):
+        return Response(status_code=304, headers=headers)
+    body = entry.encoded[encoding]
+    if cached:
+        compressor.stats.record(encoding, len(entry.body), len(body), cached=True)
+    headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=entry.media_type, headers=headers)
+
+
+class ResponseCache:
+    def __init__(self, backend, compressor=None):
+        """compressor - app.compression.Compressor; сжатые варианты тела хранятся в записях кэша"""
+        self.backend = backend
+        self.compressor = compressor
+
+    def _encode(self, request: Request, entry: CacheEntry):
+        """Pick the content coding and compress the entry once for it; returns (encoding, entry changed)"""
+        encoding = response_encoding(request, entry, self.compressor)
+        if encoding is None or encoding in entry.encoded:
+            return encoding, False
+        entry.encoded[encoding] = self.compressor.compress(entry.body, encoding)
+        return encoding, True
+
+    def respond(self, request: Request, version, build, variant: str = "") -> Response:
+        """Serve the cached entry for the request or build and store a new one
+
+        build() возвращает CacheEntry; version меняется вместе с last_updated станции,
+        поэтому устаревшие записи больше не запрашиваются и вытесняются.
+        variant различает представления одного URL (например, формат из Accept).
+        """
+        key = cache_key(request, version, variant)
+        entry = self.backend.get(key)
+        created = entry is None
+        if created:
+            entry = build()
+        encoding, encoded = self._encode(request, entry)
+        if created or encoded:
+            self.backend.set(key, entry)
+        return to_response(request, entry, encoding, self.compressor, cached=not encoded)
+
+    async def arespond(self, request: Request, version, build, variant: str = "") -> Response:
+        """Asynchronous variant of respond, build is a coroutine function"""
+        key = cache_key(request, version, variant)
+        if self.backend.blocking:
+            entry = await asyncio.to_thread(self.backend.get, key)
+        else:
+            entry = self.backend.get(key)
+        created = entry is None
+        if created:
+            entry = await build()
+        encoding, encoded = self._encode(request, entry)
+        if created or encoded:
+            if self.backend.blocking:
+                await asyncio.to_thread(self.backend.set, key, entry)
+            else:
+                self.backend.set(key, entry)
+        return to_response(request, entry, encoding, self.compressor, cached=not encoded)
@@ -0,0 +1,74 @@
+from sqlalchemy.sql import text
+
+# Исходные таблицы измерений по метрикам
+METRIC_TABLES = {
+    "water_level": "water_levels",
+    "temperature": "temperatures",
+}
+# Таблицы агрегатов по разрешениям
+ROLLUP_TABLES = {
+    "hour": "rollups_hourly",
+    "day": "rollups_daily",
+}
+
+_UPSERT = """
+    ON CONFLICT (station_id, metric, bucket) DO UPDATE SET
+        min_value = EXCLUDED.min_value,
+        max_value = EXCLUDED.max_value,
+        avg_value = EXCLUDED.avg_value,
+        count = EXCLUDED.count,
+        last_value = EXCLUDED.last_value,
+        last_timestamp = EXCLUDED.last_timestamp
+"""
+
+
+def _hourly_sql(metric, station_filter):
+    return f"""
+        INSERT INTO rollups_hourly
+            (station_id, metric, bucket, min_value, max_value, avg_value, count, last_value, last_timestamp)
+        SELECT station_id, '{metric}', date_trunc('hour', timestamp_utc) AS bucket,
+               MIN(value), MAX(value), AVG(value), COUNT(*),
+               (ARRAY_AGG(value ORDER BY timestamp_utc DESC))[1],
+               MAX(timestamp_utc)
+        FROM {METRIC_TABLES[metric]}
+        WHERE {station_filter}
+          AND timestamp_utc >= date_trunc('hour', CAST(:start AS timestamp))
+          AND timestamp_utc < date_trunc('hour', CAST(:end AS timestamp)) + interval '1 hour'
+        GROUP BY station_id, bucket
+    """ + _UPSERT
+
+
+def _daily_sql(metric, station_filter):
+    # Суточные агрегаты считаются из часовых, а не из сырых данных
+    return f"""
+        INSERT INTO rollups_daily
+            (station_id, metric, bucket, min_value, max_value, avg_value, count, last_value, last_timestamp)
+        SELECT station_id, metric, date_trunc('day', bucket) AS day,
+               MIN(min_value), MAX(max_value), SUM(avg_value * count) / SUM(count), SUM(count),
+               (ARRAY_AGG(last_value ORDER BY last_timestamp DESC))[1],
+               MAX(last_timestamp)
+        FROM rollups_hourly
+        WHERE {station_filter}
+          AND metric = '{metric}'
+          AND bucket >= date_trunc('day', CAST(:start AS timestamp))
+          AND bucket < date_trunc('day', CAST(:end AS timestamp)) + interval '1 day'
+        GROUP BY station_id, metric, day
+    """ + _UPSERT
+
+
+def refresh_rollups(db, station_id, metric, start, end):
+    """Recompute hourly and daily rollups of one station for the buckets touched by [start, end]
+
+    db - Session или Connection; вызывается в той же транзакции, что и вставка измерений.
+    """
+    params = {"station_id": station_id, "start": start, "end": end}
+    db.execute(text(_hourly_sql(metric, "station_id = :station_id")), params)
+    db.execute(text(_daily_sql(metric, "station_id = :station_id")), params)
+
+
+def backfill_rollups(conn, start, end):
+    """Recompute rollups of all stations for [start, end]"""
+    params = {"start": start, "end": end}
+    for metric in METRIC_TABLES:
+        conn.execute(text(_hourly_sql(metric, "TRUE")), params)
+        conn.execute(text(_daily_sql(metric, "TRUE")), params)
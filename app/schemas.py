@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
+from enum import Enum
 
 class StationBase(BaseModel):
     name: str
@@ -43,4 +44,51 @@ class TemperatureCreate(TemperatureBase):
 
 class Temperature(TemperatureBase):
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class Metric(str, Enum):
+    water_level = "water_level"
+    temperature = "temperature"
+
+class Resolution(str, Enum):
+    hour = "hour"
+    day = "day"
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+class DownsampleMethod(str, Enum):
+    lttb = "lttb"
+    minmax = "minmax"
+
+class Aggregate(BaseModel):
+    station_id: int
+    metric: Metric
+    timestamp: datetime  # Начало интервала (UTC)
+    min: float
+    max: float
+    avg: float
+    count: int
+    last: float
+
+class LatestReading(BaseModel):
+    station_id: int
+    water_level: Optional[float] = None
+    water_level_timestamp: Optional[datetime] = None
+    water_level_24h_ago: Optional[float] = None
+    temperature: Optional[float] = None
+    temperature_timestamp: Optional[datetime] = None
+    temperature_24h_ago: Optional[float] = None
+
+class SeriesPoint(BaseModel):
+    timestamp: datetime
+    water_level: Optional[float] = None
+    temperature: Optional[float] = None
+
+class Series(BaseModel):
+    station_id: int
+    metrics: List[Metric]
+    points: List[SeriesPoint]
+    next_cursor: Optional[str] = None
+    downsample: Optional[DownsampleMethod] = None  # Метод прореживания, если оно применялось
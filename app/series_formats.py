@@ -0,0 +1,106 @@
+import importlib.util
+import json
+
+from fastapi import HTTPException, Request
+
+from .response_cache import CacheEntry
+
+# Форматы рядов, выбираемые по заголовку Accept
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.waterlevel.columnar+json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+
+ALIASES = {
+    "*/*": JSON,
+    "application/*": JSON,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.apache.arrow.file": ARROW,
+}
+
+# msgpack и pyarrow - необязательные зависимости, форматы без них не предлагаются
+OPTIONAL_MODULES = {MSGPACK: "msgpack", ARROW: "pyarrow"}
+SUPPORTED = tuple(
+    media_type for media_type in (JSON, COLUMNAR_JSON, MSGPACK, ARROW)
+    if media_type not in OPTIONAL_MODULES or importlib.util.find_spec(OPTIONAL_MODULES[media_type]) is not None
+)
+
+# Дополнительные представления 200-го ответа для OpenAPI - только действительно доступные форматы
+OPENAPI_RESPONSES = {
+    200: {"content": {media_type: {} for media_type in SUPPORTED if media_type != JSON}},
+}
+
+
+def negotiate(request: Request) -> str:
+    """Media type of the series response chosen from Accept, JSON when the header is absent
+
+    406, если ни один из приемлемых для клиента форматов не поддерживается.
+    """
+    header = request.headers.get("accept")
+    if not header:
+        return JSON
+
+    best, best_quality = None, 0.0
+    for item in header.split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        media_type = ALIASES.get(media_type.lower(), media_type.lower())
+        if media_type in SUPPORTED and quality > best_quality:
+            best, best_quality = media_type, quality
+
+    if best is None:
+        raise HTTPException(status_code=406, detail=f"Supported formats: {', '.join(SUPPORTED)}")
+    return best
+
+
+def epoch_ms(timestamps):
+    """Naive UTC datetimes as int64 milliseconds since the epoch (numpy array)"""
+    import numpy as np  # Отложенный импорт: numpy нужен только столбцовым форматам и прореживанию
+
+    return np.array(timestamps, dtype="datetime64[ms]").astype(np.int64)
+
+
+def _columnar_json(t, columns) -> bytes:
+    payload = {"t": t.tolist(), **columns}
+    return json.dumps(payload, separators=(",", ":"), allow_nan=False).encode()
+
+
+def _msgpack(t, columns) -> bytes:
+    import msgpack
+
+    return msgpack.packb({"t": t.tolist(), **columns})
+
+
+def _arrow(t, columns) -> bytes:
+    import pyarrow as pa
+
+    table = pa.table({
+        "t": pa.array(t).cast(pa.timestamp("ms", tz="UTC")),
+        **{name: pa.array(values, type=pa.float64()) for name, values in columns.items()},
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+ENCODERS = {
+    COLUMNAR_JSON: _columnar_json,
+    MSGPACK: _msgpack,
+    ARROW: _arrow,
+}
+
+
+def columns_entry(media_type: str, timestamps, columns, headers=None) -> CacheEntry:
+    """Encode a series as columns: t (epoch ms) and one list of values per name, None for gaps
+
+    Для одной метрики columns = {"v": [...]}, для выровненного ряда - по столбцу на метрику.
+    """
+    body = ENCODERS[media_type](epoch_ms(timestamps), columns)
+    return CacheEntry.build(body, media_type=media_type, headers=dict(headers or {}, Vary="Accept"))
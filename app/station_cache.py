@@ -0,0 +1,95 @@
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from . import database, models
+from .config import get_settings
+
+# Не перечитываем таблицу stations при промахе чаще, чем раз в столько секунд
+MISS_RELOAD_INTERVAL = 5.0
+
+
+class StationCache:
+    """In-process cache of the stations table with TTL
+
+    Станции загружаются целиком в отдельной сессии, поэтому закэшированные объекты
+    не истекают при commit в сессии запроса. По истечении TTL выполняется дешёвая проверка
+    (max(last_updated), count(*)): таблица перечитывается, только если она изменилась, в том числе
+    другим процессом (загрузка списка станций обновляет last_updated изменённых станций).
+    """
+
+    def __init__(self, ttl_seconds=None):
+        """ttl_seconds=None - берётся из настроек при первом обращении"""
+        self._ttl_seconds = ttl_seconds
+        self._stations = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        # (max(last_updated), count) загруженных данных; одинакова во всех процессах,
+        # поэтому используется как версия в ключах кэша ответов
+        self.version = None
+
+    @property
+    def ttl_seconds(self):
+        if self._ttl_seconds is None:
+            self._ttl_seconds = get_settings().station_cache_ttl_seconds
+        return self._ttl_seconds
+
+    @staticmethod
+    def _freshness(db):
+        return tuple(db.execute(select(func.max(models.Station.last_updated), func.count(models.Station.id))).one())
+
+    def _load(self, check=False):
+        """Reload the table; with check=True only if its freshness differs from the loaded version"""
+        db = database.SessionLocal()
+        try:
+            freshness = self._freshness(db)
+            if not (check and freshness == self.version):
+                stations = db.query(models.Station).order_by(models.Station.id).all()
+                self._stations = {station.id: station for station in stations}
+                self.version = freshness
+        finally:
+            db.close()
+        self._loaded_at = time.monotonic()
+
+    def _age(self):
+        return time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+
+    def _ensure_fresh(self):
+        with self._lock:
+            age = self._age()
+            if age is None:
+                self._load()
+            elif age > self.ttl_seconds:
+                self._load(check=True)
+
+    def get(self, station_id):
+        """Station by id or None; an unknown id triggers a (rate-limited) reload"""
+        self._ensure_fresh()
+        station = self._stations.get(station_id)
+        if station is None:
+            with self._lock:
+                # После invalidate() возраст None - загружаем сразу
+                age = self._age()
+                if age is None or age > MISS_RELOAD_INTERVAL:
+                    self._load()
+                station = self._stations.get(station_id)
+        return station
+
+    def all(self):
+        """All stations ordered by id"""
+        self._ensure_fresh()
+        return list(self._stations.values())
+
+    def snapshot(self):
+        """(version, all stations) taken together, so a cached response never pairs one load's data with another's version"""
+        self._ensure_fresh()
+        with self._lock:
+            return self.version, list(self._stations.values())
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+station_cache = StationCache()
@@ -0,0 +1,58 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+import os
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Получаем параметры подключения к базе данных
+POSTGRES_USER = "postgres"  # Используем postgres пользователя для миграции
+POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+POSTGRES_HOST = os.getenv("POSTGRES_HOST")
+POSTGRES_PORT = os.getenv("POSTGRES_PORT")
+POSTGRES_DB = os.getenv("POSTGRES_DB")
+
+# Формируем строку подключения
+DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+
+TABLES = ("water_levels", "temperatures")
+
+def upgrade():
+    """Add unique (station_id, timestamp) constraints to water_levels and temperatures tables"""
+    engine = create_engine(DATABASE_URL)
+    
+    with engine.connect() as conn:
+        for table in TABLES:
+            # Удаляем дубликаты, оставляя самую раннюю запись
+            conn.execute(text(f"""
+                DELETE FROM {table} a
+                USING {table} b
+                WHERE a.station_id = b.station_id
+                  AND a.timestamp = b.timestamp
+                  AND a.id > b.id;
+            """))
+            
+            conn.execute(text(f"""
+                ALTER TABLE {table}
+                ADD CONSTRAINT uq_{table}_station_timestamp UNIQUE (station_id, timestamp);
+            """))
+        
+        conn.commit()
+
+def downgrade():
+    """Remove unique (station_id, timestamp) constraints"""
+    engine = create_engine(DATABASE_URL)
+    
+    with engine.connect() as conn:
+        for table in TABLES:
+            conn.execute(text(f"""
+                ALTER TABLE {table}
+                DROP CONSTRAINT uq_{table}_station_timestamp;
+            """))
+        
+        conn.commit()
+
+if __name__ == "__main__":
+    upgrade()
+    print("Migration completed successfully!")
@@ -0,0 +1,70 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.rollups import ROLLUP_TABLES, backfill_rollups
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Получаем параметры подключения к базе данных
+POSTGRES_USER = "postgres"  # Используем postgres пользователя для миграции
+POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+POSTGRES_HOST = os.getenv("POSTGRES_HOST")
+POSTGRES_PORT = os.getenv("POSTGRES_PORT")
+POSTGRES_DB = os.getenv("POSTGRES_DB")
+
+# Формируем строку подключения
+DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+
+def upgrade():
+    """Create hourly and daily rollup tables and fill them from existing measurements"""
+    engine = create_engine(DATABASE_URL)
+    
+    with engine.connect() as conn:
+        for table in ROLLUP_TABLES.values():
+            conn.execute(text(f"""
+                CREATE TABLE {table} (
+                    station_id INTEGER NOT NULL REFERENCES stations (id),
+                    metric VARCHAR NOT NULL,
+                    bucket TIMESTAMP NOT NULL,
+                    min_value DOUBLE PRECISION,
+                    max_value DOUBLE PRECISION,
+                    avg_value DOUBLE PRECISION,
+                    count INTEGER,
+                    last_value DOUBLE PRECISION,
+                    last_timestamp TIMESTAMP,
+                    PRIMARY KEY (station_id, metric, bucket)
+                );
+            """))
+        
+        # Заполняем агрегаты за весь период хранения
+        bounds = conn.execute(text("""
+            SELECT LEAST(
+                       (SELECT MIN(timestamp_utc) FROM water_levels),
+                       (SELECT MIN(timestamp_utc) FROM temperatures)),
+                   GREATEST(
+                       (SELECT MAX(timestamp_utc) FROM water_levels),
+                       (SELECT MAX(timestamp_utc) FROM temperatures));
+        """)).one()
+        if bounds[0] is not None:
+            backfill_rollups(conn, bounds[0], bounds[1])
+        
+        conn.commit()
+
+def downgrade():
+    """Drop rollup tables"""
+    engine = create_engine(DATABASE_URL)
+    
+    with engine.connect() as conn:
+        for table in ROLLUP_TABLES.values():
+            conn.execute(text(f"DROP TABLE {table};"))
+        
+        conn.commit()
+
+if __name__ == "__main__":
+    upgrade()
+    print("Migration completed successfully!")
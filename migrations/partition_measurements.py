@@ -0,0 +1,119 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from datetime import date
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.partitions import (
+    PARTITIONED_TABLES, MONTHS_AHEAD, add_months, create_partitions, create_brin_indexes, month_start
+)
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Получаем параметры подключения к базе данных
+POSTGRES_USER = "postgres"  # Используем postgres пользователя для миграции
+POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+POSTGRES_HOST = os.getenv("POSTGRES_HOST")
+POSTGRES_PORT = os.getenv("POSTGRES_PORT")
+POSTGRES_DB = os.getenv("POSTGRES_DB")
+
+# Формируем строку подключения
+DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+
+def upgrade():
+    """Convert water_levels and temperatures to monthly range partitions on timestamp_utc
+
+    Уникальный ключ секционированной таблицы обязан включать ключ секционирования,
+    поэтому (station_id, timestamp) расширяется до (station_id, timestamp, timestamp_utc).
+    """
+    engine = create_engine(DATABASE_URL)
+    
+    with engine.connect() as conn:
+        for table in PARTITIONED_TABLES:
+            # Переименовываем старую таблицу вместе с её ограничениями и индексами
+            conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_legacy;"))
+            conn.execute(text(f"ALTER TABLE {table}_legacy RENAME CONSTRAINT {table}_pkey TO {table}_legacy_pkey;"))
+            conn.execute(text(f"""
+                ALTER TABLE {table}_legacy
+                RENAME CONSTRAINT uq_{table}_station_timestamp TO uq_{table}_legacy_station_timestamp;
+            """))
+            conn.execute(text(f"ALTER INDEX IF EXISTS ix_{table}_id RENAME TO ix_{table}_legacy_id;"))
+            
+            conn.execute(text(f"""
+                CREATE TABLE {table} (
+                    id INTEGER NOT NULL DEFAULT nextval('{table}_id_seq'),
+                    station_id INTEGER REFERENCES stations (id),
+                    timestamp TIMESTAMP,
+                    timestamp_utc TIMESTAMP NOT NULL,
+                    value DOUBLE PRECISION,
+                    CONSTRAINT {table}_pkey PRIMARY KEY (id, timestamp_utc),
+                    CONSTRAINT uq_{table}_station_timestamp UNIQUE (station_id, timestamp, timestamp_utc)
+                ) PARTITION BY RANGE (timestamp_utc);
+            """))
+            conn.execute(text(f"CREATE INDEX ix_{table}_id ON {table} (id);"))
+            conn.execute(text(f"CREATE INDEX ix_{table}_station_timestamp_utc ON {table} (station_id, timestamp_utc);"))
+            # Строки вне созданных секций попадают сюда, а не приводят к ошибке вставки
+            conn.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;"))
+            
+            # Секции от самого старого месяца с данными до MONTHS_AHEAD месяцев вперёд
+            first = conn.execute(text(f"""
+                SELECT MIN(COALESCE(timestamp_utc, timestamp)) FROM {table}_legacy;
+            """)).scalar()
+            current = month_start(date.today())
+            create_partitions(
+                conn, table,
+                month_start(first) if first else current,
+                add_months(current, MONTHS_AHEAD)
+            )
+            
+            conn.execute(text(f"""
+                INSERT INTO {table} (id, station_id, timestamp, timestamp_utc, value)
+                SELECT id, station_id, timestamp, COALESCE(timestamp_utc, timestamp), value
+                FROM {table}_legacy;
+            """))
+            conn.execute(text(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id;"))
+            conn.execute(text(f"DROP TABLE {table}_legacy;"))
+            
+            create_brin_indexes(conn, table)
+        
+        conn.commit()
+
+def downgrade():
+    """Convert partitioned water_levels and temperatures back to plain tables"""
+    engine = create_engine(DATABASE_URL)
+    
+    with engine.connect() as conn:
+        for table in PARTITIONED_TABLES:
+            conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_partitioned;"))
+            conn.execute(text(f"""
+                CREATE TABLE {table} (
+                    id INTEGER NOT NULL DEFAULT nextval('{table}_id_seq'),
+                    station_id INTEGER REFERENCES stations (id),
+                    timestamp TIMESTAMP,
+                    timestamp_utc TIMESTAMP,
+                    value DOUBLE PRECISION
+                );
+            """))
+            conn.execute(text(f"""
+                INSERT INTO {table} (id, station_id, timestamp, timestamp_utc, value)
+                SELECT id, station_id, timestamp, timestamp_utc, value
+                FROM {table}_partitioned;
+            """))
+            conn.execute(text(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id;"))
+            # Вместе с родительской таблицей удаляются все секции и их индексы
+            conn.execute(text(f"DROP TABLE {table}_partitioned;"))
+            conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id);"))
+            conn.execute(text(f"CREATE INDEX ix_{table}_id ON {table} (id);"))
+            conn.execute(text(f"""
+                ALTER TABLE {table}
+                ADD CONSTRAINT uq_{table}_station_timestamp UNIQUE (station_id, timestamp);
+            """))
+        
+        conn.commit()
+
+if __name__ == "__main__":
+    upgrade()
+    print("Migration completed successfully!")
@@ -0,0 +1,213 @@
+import asyncio
+import heapq
+import os
+import random
+import signal
+import sys
+import time
+
+import aiohttp
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+from app.logging_config import setup_logging
+from fetcher import HostRateLimiter
+from fill_measurements import ensure_partitions, process_station, prune_spool, replay_spool
+from high_water import high_water_marks, load_high_water_marks
+
+logger = setup_logging("scheduler")
+
+# Сколько последних точек используется для оценки периода отправки данных станцией
+CADENCE_WINDOW = 48
+# Вес нового наблюдения задержки публикации в экспоненциальном среднем
+LAG_SMOOTHING = 0.3
+# Как часто перечитывать список станций и обслуживать секции и спул
+STATIONS_REFRESH_SECONDS = 600
+PARTITIONS_REFRESH_SECONDS = 3600
+
+
+class StationCadence:
+    """Learned reporting cadence of one station and the delay until its next poll
+
+    cadence_ms - медиана интервалов между последними точками ряда; lag_ms - сглаженная задержка
+    между временем последней точки и моментом, когда она появилась на странице (включает смещение
+    часов станции). Следующий опрос назначается на ожидаемое появление новой точки; если опрос
+    не нашёл новых данных, интервал увеличивается вдвое до max_interval.
+    """
+
+    def __init__(self, default_interval, min_interval, max_interval, jitter=0.1):
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.cadence_ms = None
+        self.lag_ms = None
+        self.latest_ms = None
+        self.misses = 0
+
+    def observe_series(self, series):
+        """Learn the cadence from the timestamps of a fetched page"""
+        timestamps = max((series.metric(metric).timestamps for metric in ('water_level', 'temperature')), key=len)
+        diffs = np.diff(timestamps[-CADENCE_WINDOW:])
+        diffs = diffs[diffs > 0]
+        if len(diffs):
+            self.cadence_ms = float(np.median(diffs))
+
+    def observe_poll(self, latest_ms, now_ms):
+        """Record a finished poll; latest_ms is the station's high-water mark after it"""
+        if latest_ms is not None and (self.latest_ms is None or latest_ms > self.latest_ms):
+            lag = max(now_ms - latest_ms, 0.0)
+            self.lag_ms = lag if self.lag_ms is None else (1 - LAG_SMOOTHING) * self.lag_ms + LAG_SMOOTHING * lag
+            self.latest_ms = latest_ms
+            self.misses = 0
+        else:
+            self.misses += 1
+
+    def next_delay(self, now_ms):
+        """Seconds until the next poll, with jitter"""
+        if self.cadence_ms is None or self.latest_ms is None:
+            delay = self.default_interval
+        else:
+            expected_ms = self.latest_ms + self.cadence_ms + (self.lag_ms or 0.0)
+            delay = (expected_ms - now_ms) / 1000
+            if self.misses:
+                # Данные не появились в ожидаемое время - отступаем экспоненциально
+                delay = max(delay, self.min_interval * 2 ** self.misses)
+        delay = min(max(delay, self.min_interval), self.max_interval)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class AdaptiveScheduler:
+    """Polls every station on its own adaptive interval; a station is never fetched twice at once"""
+
+    def __init__(self, default_interval=None, min_interval=None, max_interval=None, jitter=None):
+        self.default_interval = default_interval or settings.scheduler_interval_minutes * 60
+        self.min_interval = min_interval or settings.scheduler_min_interval_seconds
+        self.max_interval = max_interval or settings.scheduler_max_interval_minutes * 60
+        self.jitter = settings.scheduler_jitter_fraction if jitter is None else jitter
+        self.stations = {}
+        self.cadences = {}
+        self.in_flight = set()
+        self._due = []  # куча (monotonic time, station_id)
+        self._stop = asyncio.Event()
+        self._wakeup = asyncio.Event()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, self.stop)
+            except NotImplementedError:
+                # Windows: обработчик вызывается вне цикла событий
+                signal.signal(signum, lambda *_: loop.call_soon_threadsafe(self.stop))
+
+    def _schedule(self, station_id, delay):
+        heapq.heappush(self._due, (time.monotonic() + delay, station_id))
+        self._wakeup.set()
+
+    def load_stations(self):
+        db = SessionLocal()
+        try:
+            return db.query(models.Station).all()
+        finally:
+            db.close()
+
+    async def refresh_stations(self):
+        stations = await asyncio.to_thread(self.load_stations)
+        # Окна загрузки новых станций определяются по последним сохранённым точкам, а не полные 14 дней
+        await asyncio.to_thread(load_high_water_marks, [station.id for station in stations])
+        known = set(self.stations)
+        self.stations = {station.id: station for station in stations}
+        for station_id in self.stations.keys() - known:
+            self.cadences[station_id] = StationCadence(
+                self.default_interval, self.min_interval, self.max_interval, self.jitter
+            )
+            # Первые опросы распределяются по минимальному интервалу, а не одной пачкой
+            self._schedule(station_id, random.uniform(0, self.min_interval))
+        for station_id in known - self.stations.keys():
+            self.cadences.pop(station_id, None)
+        logger.info(f"Polling {len(self.stations)} stations")
+
+    async def poll(self, session, station, limiter, semaphore):
+        cadence = self.cadences[station.id]
+        try:
+            await process_station(session, station, limiter, semaphore, on_series=cadence.observe_series)
+        finally:
+            self.in_flight.discard(station.id)
+            marks = [mark for mark in high_water_marks.get(station.id, {}).values() if mark is not None]
+            now_ms = time.time() * 1000
+            cadence.observe_poll(max(marks) if marks else None, now_ms)
+            if station.id in self.stations and not self._stop.is_set():
+                delay = cadence.next_delay(now_ms)
+                logger.info(f"Station {station.name}: next poll in {delay:.0f}s")
+                self._schedule(station.id, delay)
+
+    async def maintain_spool(self):
+        """Replay pages left pending by failed writes, then delete old fully processed segments"""
+        try:
+            await replay_spool()
+        except Exception as e:
+            logger.error(f"Error replaying spool: {str(e)}")
+        await asyncio.to_thread(prune_spool)
+
+    async def run(self):
+        self.install_signal_handlers()
+        logger.info(
+            f"Adaptive scheduler started: intervals {self.min_interval:.0f}s..{self.max_interval:.0f}s, "
+            f"default {self.default_interval:.0f}s"
+        )
+        limiter = HostRateLimiter(settings.ingest_requests_per_second)
+        semaphore = asyncio.Semaphore(settings.ingest_concurrency)
+        connector = aiohttp.TCPConnector(limit=settings.ingest_concurrency)
+        tasks = set()
+        spool_task = None
+        next_stations_refresh = next_partitions_refresh = 0.0
+
+        async with aiohttp.ClientSession(connector=connector) as session:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                if now >= next_partitions_refresh:
+                    await asyncio.to_thread(ensure_partitions)
+                    # Переигровка может быть долгой после сбоя базы, поэтому идёт параллельно с опросами
+                    if spool_task is None or spool_task.done():
+                        spool_task = asyncio.create_task(self.maintain_spool())
+                        tasks.add(spool_task)
+                        spool_task.add_done_callback(tasks.discard)
+                    next_partitions_refresh = now + PARTITIONS_REFRESH_SECONDS
+                if now >= next_stations_refresh:
+                    try:
+                        await self.refresh_stations()
+                    except Exception as e:
+                        logger.error(f"Error loading stations: {str(e)}")
+                    next_stations_refresh = now + STATIONS_REFRESH_SECONDS
+
+                while self._due and self._due[0][0] <= now:
+                    _, station_id = heapq.heappop(self._due)
+                    station = self.stations.get(station_id)
+                    # Станция уже опрашивается или удалена - повторный запуск не нужен
+                    if station is None or station_id in self.in_flight:
+                        continue
+                    self.in_flight.add(station_id)
+                    task = asyncio.create_task(self.poll(session, station, limiter, semaphore))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+                wait = min(next_stations_refresh, next_partitions_refresh) - now
+                if self._due:
+                    wait = min(wait, self._due[0][0] - now)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(wait, 0))
+                except asyncio.TimeoutError:
+                    pass
+
+            logger.info(f"Stopping scheduler, waiting for {len(tasks)} running polls")
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
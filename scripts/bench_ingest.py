@@ -0,0 +1,316 @@
+"""End-to-end ingest benchmark against a local stand-in for meteo.co.me
+
+Локальный aiohttp-сервер (отдельный процесс) отдаёт aws_h.php со списком из N станций и
+aws-graph-h.php с синтетическими минутными рядами, заканчивающимися текущим временем, либо
+записанные страницы (--pages, например из `payload_spool.py export`). Затем против локального
+Postgres выполняются fill_stations_table и загрузка измерений (холодный прогон с полными окнами и
+повторные тёплые прогоны) с подсчётом обращений к базе. --ingest выбирает путь загрузки:
+pipeline - update_all_stations (конвейер полного обновления), scheduler - AdaptiveScheduler ->
+process_station, как в рабочем планировщике (один прогон - один опрос каждой станции).
+
+База по умолчанию - отдельная waterlevel_bench: создаётся при отсутствии, таблицы очищаются перед
+запуском (--keep-data оставляет данные). Очистка базы, в имени которой нет "bench", требует --force.
+
+Usage:
+    python scripts/bench_ingest.py --stations 100
+    python scripts/bench_ingest.py --stations 100 --ingest scheduler
+    python scripts/bench_ingest.py --stations 10000 --latency-ms 200 --step-minutes 10 --warm-runs 2
+    python scripts/bench_ingest.py --pages corpus/ --stations 50 --json ingest.json
+"""
+import argparse
+import asyncio
+import functools
+import glob
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+DAY_MS = 86_400_000
+
+
+def stations_page(count):
+    """aws_h.php with count stations split between the two basins"""
+    stations = [
+        [f"B{i:05d}", "-", round(41.9 + (i % 100) / 100, 4), round(18.5 + (i // 100 % 100) / 100, 4),
+         100 + i % 900, f"Bench station {i}", "hidro", f"River {i % 37}", 1]
+        for i in range(1, count + 1)
+    ]
+    half = count // 2
+    return (
+        "<html><body><script>\n"
+        f"var staniceH = {{jadranski: {json.dumps(stations[:half])}, crnomorski: {json.dumps(stations[half:])}}};\n"
+        "</script></body></html>\n"
+    )
+
+
+def serve(port, options):
+    """Run the local upstream until terminated (child process)"""
+    from aiohttp import web
+    from bench_parser import synthetic_page
+
+    step_ms = options["step_minutes"] * 60_000
+    stations_html = stations_page(options["stations"])
+    recorded = []
+    if options["pages"]:
+        for path in sorted(glob.glob(os.path.join(options["pages"], "*.html"))):
+            with open(path, encoding="utf-8") as f:
+                recorded.append(f.read())
+
+    @functools.lru_cache(maxsize=64)
+    def graph_page(days, end_ms):
+        points = days * DAY_MS // step_ms
+        return synthetic_page(points, start_ms=end_ms - (points - 1) * step_ms, step_ms=step_ms)
+
+    async def delay():
+        latency = options["latency_ms"] + random.uniform(-options["jitter_ms"], options["jitter_ms"])
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    async def stations_handler(request):
+        await delay()
+        return web.Response(text=stations_html, content_type="text/html")
+
+    async def graph_handler(request):
+        await delay()
+        if recorded:
+            page = recorded[hash(request.query.get("s", "")) % len(recorded)]
+        else:
+            days = int(request.query.get("d", "14d").rstrip("d") or 14)
+            # Ряд заканчивается текущим шагом: повторные прогоны получают новые точки
+            page = graph_page(days, int(time.time() * 1000) // step_ms * step_ms)
+        return web.Response(text=page, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/aws_h.php", stations_handler)
+    app.router.add_get("/aws-graph-h.php", graph_handler)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Local upstream did not start on port {port}")
+
+
+def prepare_database(keep_data, force=False):
+    """Create the benchmark database if needed, the schema and partitions; empty the tables
+
+    Таблицы очищаются только в отдельной базе для бенчмарков (имя содержит "bench") или с force.
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.sql import text
+
+    from app.database import database_url, get_engine
+    from init_db import init_db
+
+    url = make_url(database_url())
+    if not keep_data and "bench" not in url.database and not force:
+        sys.exit(
+            f'Refusing to empty tables of "{url.database}": use a dedicated *bench* database, --keep-data or --force'
+        )
+    admin = create_engine(url.set(database="postgres"), isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        exists = conn.execute(text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": url.database}).first()
+        if not exists:
+            conn.execute(text(f'CREATE DATABASE "{url.database}"'))
+    admin.dispose()
+
+    init_db()
+    if not keep_data:
+        with get_engine().begin() as conn:
+            conn.execute(text(
+                "TRUNCATE stations, water_levels, temperatures, rollups_hourly, rollups_daily RESTART IDENTITY CASCADE"
+            ))
+
+
+class RoundTripCounter:
+    """Statements sent through the sync engine (executemany counts once)"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def run_scheduler_round():
+    """Poll every station once through AdaptiveScheduler -> process_station, returns the total WriteResult"""
+    import adaptive_polling
+    from adaptive_polling import AdaptiveScheduler
+    from ingest_writer import WriteResult
+
+    total = WriteResult()
+    process_station = adaptive_polling.process_station
+
+    async def counting_process_station(*args, **kwargs):
+        nonlocal total
+        results = await process_station(*args, **kwargs)
+        for result in results or ():
+            total += result
+        return results
+
+    class OneRoundScheduler(AdaptiveScheduler):
+        """Polls every station once, then stops"""
+
+        def __init__(self):
+            super().__init__()
+            self.polled = set()
+
+        def _schedule(self, station_id, delay):
+            # Первые опросы назначаются сразу, повторные - не назначаются
+            if station_id not in self.polled:
+                super()._schedule(station_id, 0.0)
+
+        async def refresh_stations(self):
+            await super().refresh_stations()
+            if not self.stations:
+                self.stop()
+
+        async def poll(self, session, station, limiter, semaphore):
+            self.polled.add(station.id)
+            await super().poll(session, station, limiter, semaphore)
+            if self.polled >= self.stations.keys():
+                self.stop()
+
+    # Подмена только для подсчёта вставленных строк; сам опрос идёт рабочим кодом
+    adaptive_polling.process_station = counting_process_station
+    try:
+        asyncio.run(OneRoundScheduler().run())
+    finally:
+        adaptive_polling.process_station = process_station
+    return total
+
+
+def run_phase(name, counter, func):
+    before = counter.count
+    started = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - started
+    return {"name": name, "seconds": round(seconds, 3), "round_trips": counter.count - before}, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end ingest benchmark with a local upstream')
+    parser.add_argument('--stations', type=int, default=100, help='Number of stations (10..10000)')
+    parser.add_argument('--step-minutes', type=int, default=1, help='Interval between synthetic points')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Upstream response latency')
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help='Random +- latency jitter')
+    parser.add_argument('--pages', help='Serve recorded aws-graph-h.php pages (*.html) instead of synthetic ones')
+    parser.add_argument('--ingest', choices=('pipeline', 'scheduler'), default='pipeline',
+                        help='update_all_stations pipeline or the production AdaptiveScheduler -> process_station path')
+    parser.add_argument('--warm-runs', type=int, default=1, help='Incremental runs after the cold one')
+    parser.add_argument('--rps', type=float, default=0, help='Per-host request rate limit, 0 - unlimited')
+    parser.add_argument('--fetch-workers', type=int)
+    parser.add_argument('--parse-workers', type=int)
+    parser.add_argument('--write-workers', type=int)
+    parser.add_argument('--database', default='waterlevel_bench', help='Postgres database (created if missing)')
+    parser.add_argument('--keep-data', action='store_true', help='Do not empty the tables before the run')
+    parser.add_argument('--force', action='store_true', help='Empty the tables even if the database is not a *bench* one')
+    parser.add_argument('--no-spool', action='store_true', help='Disable the payload spool')
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+
+    port = free_port()
+    spool_dir = None if args.no_spool else tempfile.mkdtemp(prefix="bench-spool-")
+    # Настройки читаются при первом обращении, поэтому окружение задаётся до импорта модулей загрузки
+    os.environ.update(
+        UPSTREAM_BASE_URL=f"http://127.0.0.1:{port}",
+        POSTGRES_DB=args.database,
+        INGEST_REQUESTS_PER_SECOND=str(args.rps),
+        INGEST_SPOOL_DIR=spool_dir or "",
+    )
+    if args.fetch_workers:
+        # Параллелизм планировщика задаётся настройкой
+        os.environ["INGEST_CONCURRENCY"] = str(args.fetch_workers)
+
+    options = {
+        "stations": args.stations,
+        "step_minutes": args.step_minutes,
+        "latency_ms": args.latency_ms,
+        "jitter_ms": args.jitter_ms,
+        "pages": args.pages,
+    }
+    server = multiprocessing.Process(target=serve, args=(port, options), daemon=True)
+    server.start()
+    try:
+        wait_for_port(port)
+
+        from app.database import get_engine
+        from fill_measurements import update_all_stations
+        from ingest_pipeline import IngestPipeline
+        from scrape_stations import fill_stations_table
+
+        prepare_database(args.keep_data, args.force)
+        counter = RoundTripCounter(get_engine())
+        report = {
+            "config": dict(options, database=args.database, rps=args.rps, spool=not args.no_spool, ingest=args.ingest),
+            "phases": [],
+        }
+
+        phase, _ = run_phase("fill_stations_table", counter, lambda: fill_stations_table(fetch_data=False))
+        report["phases"].append(phase)
+
+        for run in range(1 + args.warm_runs):
+            label = "cold" if run == 0 else f"warm {run}"
+            if args.ingest == 'scheduler':
+                phase, total = run_phase(f"scheduler round {label}", counter, run_scheduler_round)
+                stages = {}
+            else:
+                pipeline = IngestPipeline(
+                    fetch_workers=args.fetch_workers, parse_workers=args.parse_workers, write_workers=args.write_workers
+                )
+                phase, total = run_phase(
+                    f"update_all_stations {label}", counter, lambda: asyncio.run(update_all_stations(pipeline))
+                )
+                stages = {name: stats.to_dict() for name, stats in pipeline.stats.items()}
+            phase.update(
+                points_inserted=total.inserted,
+                points_skipped=total.skipped,
+                points_per_second=round(total.inserted / phase["seconds"], 1) if phase["seconds"] else None,
+                stages=stages,
+            )
+            report["phases"].append(phase)
+    finally:
+        server.terminate()
+        server.join()
+        if spool_dir:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+    for phase in report["phases"]:
+        line = f"{phase['name']:>28}: {phase['seconds']:8.2f} s, {phase['round_trips']:6d} DB round trips"
+        if "points_inserted" in phase:
+            line += f", {phase['points_inserted']} points ({phase['points_per_second']} points/s)"
+            for name, stats in phase["stages"].items():
+                line += f"\n{name:>34}: {stats['items']} items, busy {stats['busy_seconds']} s, {stats['items_per_second']} items/s"
+        print(line)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
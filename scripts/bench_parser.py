@@ -0,0 +1,85 @@
+"""Micro-benchmark: regex + json.loads parser vs single-pass payload_parser
+
+Usage:
+    python scripts/bench_parser.py --pages captured/        # сохранённые страницы aws-graph-h.php (*.html)
+    python scripts/bench_parser.py --points 20160           # синтетическая страница (14 дней минутных данных)
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from payload_parser import parse_graph_page, preprocess_js_object
+
+
+def legacy_parse(page_text):
+    """Previous scrape_stations.get_station_data parsing path"""
+    data_matches = re.findall(r'var\s+Data_m\s*=\s*(\{.*?\});', page_text, re.DOTALL)
+    data_h_matches = re.findall(r'var\s+Data_h\s*=\s*(\{.*?\});', page_text, re.DOTALL)
+    data = {'water_level': [], 'temperature': [], 'timestamps': []}
+    for matches in (data_matches, data_h_matches):
+        if not matches or data['timestamps']:
+            continue
+        parsed = json.loads(preprocess_js_object(matches[0]))
+        if 'G1' in parsed and 'V' in parsed['G1'] and 'Tv' in parsed['G1']:
+            for key, metric in (('Tv', 'temperature'), ('V', 'water_level')):
+                for point in parsed['G1'][key]:
+                    if len(point) >= 2:
+                        data['timestamps'].append(datetime.fromtimestamp(point[0] / 1000))
+                        data[metric].append(point[1])
+    return data
+
+
+def synthetic_page(points, start_ms=1_700_000_000_000, step_ms=60_000):
+    """Build a page shaped like aws-graph-h.php with minute data"""
+    rnd = random.Random(42)
+
+    def series(base):
+        values = []
+        for i in range(points):
+            value = 'null' if rnd.random() < 0.01 else f"{base + rnd.uniform(-5, 5):.1f}"
+            values.append(f"[{start_ms + i * step_ms},{value}]")
+        return "[" + ",".join(values) + "]"
+
+    return (
+        "<html><head><script src='highcharts.js'></script></head><body>\n"
+        "<script>\n"
+        f"var Data_m = {{G1: {{name: 'Vodostaj', V: {series(120)}, Tv: {series(14)}}}}};\n"
+        "var Data_h = {G1: {name: 'Vodostaj', V: [], Tv: []}};\n"
+        "</script></body></html>\n"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark station graph page parsers')
+    parser.add_argument('--pages', help='Directory with captured aws-graph-h.php pages (*.html)')
+    parser.add_argument('--points', type=int, default=20160, help='Points per series for the synthetic page')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages, '*.html'))):
+            with open(path, encoding='utf-8') as f:
+                pages.append(f.read())
+        if not pages:
+            sys.exit(f"No *.html pages found in {args.pages}")
+    else:
+        pages = [synthetic_page(args.points)]
+
+    total_bytes = sum(len(page) for page in pages)
+    print(f"{len(pages)} page(s), {total_bytes / 1024:.0f} KiB")
+
+    for name, func in (('legacy regex+json', legacy_parse), ('payload_parser', parse_graph_page)):
+        best = min(timeit.repeat(lambda: [func(page) for page in pages], number=1, repeat=args.repeat))
+        print(f"{name:>20}: {best * 1000:8.1f} ms  ({total_bytes / best / 1024 / 1024:6.1f} MiB/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Micro-benchmark: pydantic + jsonable_encoder + JSONResponse vs orjson on row tuples
+
+Сравнивает сборку тела ответа /stations/{id}/water-levels/ прежним путём (модель на каждую
+строку) и быстрым путём app.fast_json.records; обращение к базе не измеряется.
+
+Usage:
+    python scripts/bench_serialization.py                      # 1k, 10k и 100k строк
+    python scripts/bench_serialization.py --rows 5000 --repeat 10
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app import fast_json, schemas
+
+
+def synthetic_rows(count, station_id=1):
+    """(timestamp_utc, value, id) tuples as returned by crud_async.get_series_rows"""
+    rnd = random.Random(42)
+    start = datetime(2024, 1, 1)
+    return [
+        (start + timedelta(minutes=i), round(120 + rnd.uniform(-5, 5), 1), i + 1)
+        for i in range(count)
+    ]
+
+
+def legacy_body(station_id, levels):
+    """Previous read_water_levels path: ORM objects -> schemas.WaterLevel -> jsonable_encoder -> JSONResponse"""
+    return JSONResponse(content=jsonable_encoder([
+        schemas.WaterLevel(station_id=level.station_id, timestamp=level.timestamp_utc, value=level.value)
+        for level in levels
+    ])).body
+
+
+def fast_body(station_id, rows):
+    return fast_json.records(rows, ("timestamp", "value"), station_id=station_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark list endpoint JSON serialization')
+    parser.add_argument('--rows', type=int, action='append', help='Row counts (default: 1000, 10000, 100000)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for count in args.rows or [1000, 10000, 100000]:
+        rows = synthetic_rows(count)
+        # Прежний путь получал ORM-объекты, здесь их заменяют объекты с теми же атрибутами
+        levels = [SimpleNamespace(station_id=1, timestamp_utc=ts, value=value, id=row_id) for ts, value, row_id in rows]
+
+        legacy, fast = legacy_body(1, levels), fast_body(1, rows)
+        if json.loads(legacy) != json.loads(fast):
+            sys.exit(f"Bodies differ for {count} rows")
+
+        print(f"{count} rows, {len(fast) / 1024:.0f} KiB")
+        timings = {}
+        for name, func, data in (('pydantic path', legacy_body, levels), ('orjson rows', fast_body, rows)):
+            timings[name] = min(timeit.repeat(lambda: func(1, data), number=1, repeat=args.repeat))
+            print(f"{name:>20}: {timings[name] * 1000:8.1f} ms  ({count / timings[name]:10.0f} rows/s)")
+        print(f"{'speedup':>20}: {timings['pydantic path'] / timings['orjson rows']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Startup benchmark: import of app.main and uvicorn spawn to the first answered request
+
+По умолчанию POSTGRES_HOST подменяется недоступным адресом (TEST-NET-1): если импорт или запуск
+приложения обращается к базе, запуск зависнет или упадёт, а не покажет хорошее время.
+
+Usage:
+    python scripts/bench_startup.py                 # 5 запусков, GET /health
+    python scripts/bench_startup.py --runs 10 --path /openapi.json
+    python scripts/bench_startup.py --keep-env      # с настройками из окружения и .env
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def bench_env(keep_env):
+    env = dict(os.environ)
+    if not keep_env:
+        env.update(
+            POSTGRES_USER="bench",
+            POSTGRES_PASSWORD="bench",
+            POSTGRES_HOST="192.0.2.1",
+            POSTGRES_PORT="5432",
+            POSTGRES_DB="bench",
+        )
+    return env
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def import_time(env):
+    """Seconds spent in `import app.main` in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def first_request_time(env, path, timeout):
+    """Seconds from spawning uvicorn to the first successful response on path"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise TimeoutError(f"No response from {url} within {timeout} s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def report(name, samples):
+    print(f"{name:>24}: min {min(samples) * 1000:7.1f} ms  median {statistics.median(samples) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark API worker startup')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/health', help='Endpoint requested as the first request')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--keep-env', action='store_true', help='Do not point POSTGRES_HOST at an unreachable address')
+    args = parser.parse_args()
+
+    env = bench_env(args.keep_env)
+    report("import app.main", [import_time(env) for _ in range(args.runs)])
+    report(f"spawn -> GET {args.path}", [first_request_time(env, args.path, args.timeout) for _ in range(args.runs)])
+
+
+if __name__ == "__main__":
+    main()
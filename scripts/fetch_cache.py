@@ -0,0 +1,61 @@
+import hashlib
+import threading
+
+# Возвращается вместо данных, если страница станции не изменилась с прошлой загрузки
+UNCHANGED = object()
+
+
+class FetchCache:
+    """Per-station ETag / Last-Modified validators and body hashes of the last fetched page"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def conditional_headers(self, key, url):
+        """Headers for a conditional request, empty if the page was not fetched from this url before"""
+        entry = self._entries.get(key)
+        if not entry or entry['url'] != url:
+            return {}
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, key, url, status, headers, body):
+        """Record a fetch result, returns False if the page is unchanged (304 or same body hash)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if status == 304 and entry and entry['url'] == url:
+                self.hits += 1
+                return False
+            
+            digest = hashlib.blake2b(body.encode('utf-8'), digest_size=16).digest()
+            unchanged = entry is not None and entry['url'] == url and entry['digest'] == digest
+            self._entries[key] = {
+                'url': url,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'digest': digest,
+            }
+            if unchanged:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return not unchanged
+
+    def invalidate(self, key):
+        """Forget the station page, e.g. when its data could not be saved"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+# Общий кэш процесса: используется get_station_data и fetch_station_data по умолчанию
+fetch_cache = FetchCache()
@@ -0,0 +1,63 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+class HostRateLimiter:
+    """Ограничивает частоту запросов к каждому хосту отдельно"""
+
+    def __init__(self, requests_per_second):
+        self.min_interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_slot = {}
+        self._locks = {}
+
+    async def acquire(self, url):
+        """Wait until a request to the url's host is allowed"""
+        host = urlsplit(url).netloc
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def fetch_response(session, url, headers=None, limiter=None, timeout=30.0, retries=3, backoff=1.0):
+    """Fetch url, retrying network errors and 5xx/429 responses with exponential backoff
+
+    Returns (status, headers, text); 304 Not Modified is returned as is with an empty text.
+    """
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire(url)
+        try:
+            # Сайт отдаёт некорректный сертификат, как и в синхронной версии (verify=False)
+            async with session.get(url, headers=headers, ssl=False, timeout=client_timeout) as response:
+                if response.status == 429 or response.status >= 500:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info,
+                        response.history,
+                        status=response.status,
+                        message=response.reason or "",
+                    )
+                response.raise_for_status()
+                return response.status, response.headers, await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status == 429 or e.status >= 500
+            if not retryable or attempt >= retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+async def fetch_text(session, url, limiter=None, timeout=30.0, retries=3, backoff=1.0):
+    """Fetch url as text"""
+    _, _, text = await fetch_response(session, url, limiter=limiter, timeout=timeout,
+                                      retries=retries, backoff=backoff)
+    return text
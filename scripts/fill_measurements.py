@@ -1,143 +1,271 @@
 import asyncio
-import aiohttp
 import json
 import re
 from datetime import datetime, timezone, timedelta
 import sys
 import os
 import logging
+import time
 from logging.handlers import RotatingFileHandler
 
 # Добавляем родительскую директорию в путь поиска модулей
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from app.database import SessionLocal
+from app.database import SessionLocal, engine
+from app.partitions import maintain_partitions
+from app.rollups import refresh_rollups
+from app.config import settings
 from app import models
-from scrape_stations import get_station_data, preprocess_js_object
+from scrape_stations import fetch_station_page, generate_graph_url, parse_station_data
+from payload_spool import get_spool
+from ingest_writer import WriteResult, insert_measurements
+from station_series import to_float64, to_local_datetimes
+from fetch_cache import UNCHANGED, fetch_cache
+from high_water import choose_fetch_days, high_water_marks, load_high_water_marks, update_high_water_marks
 from app.logging_config import setup_logging
 
 # Настройка логирования
 logger = setup_logging("scheduler")
 
-async def process_station(session, station_code, station_name, db):
-    """Process single station and save its measurements to database"""
+def measurement_rows(station, series):
+    """Build insert rows for one metric, applying the station time offset to the whole array"""
+    values = to_float64(series.values).tolist()
+    timestamps = to_local_datetimes(series.timestamps)
+    # Применяем смещение времени станции (по умолчанию 0)
+    timestamps_utc = to_local_datetimes(series.timestamps, station.time_offset or 0)
+    return [
+        {
+            'station_id': station.id,
+            'timestamp': timestamp,
+            'timestamp_utc': timestamp_utc,
+            'value': value
+        }
+        for timestamp, timestamp_utc, value in zip(timestamps, timestamps_utc, values)
+    ]
+
+def save_station_data(station_id, series):
+    """Save station series to database in a separate session"""
+    db = SessionLocal()
     try:
-        logger.info(f"Fetching data for station {station_name} ({station_code})...")
-        data = get_station_data(station_code, station_name)
-        
-        if not data:
-            logger.warning(f"No data for station {station_name}")
-            return
-        
-        # Get station from database
-        station = db.query(models.Station).filter(models.Station.code == station_code).first()
+        station = db.query(models.Station).filter(models.Station.id == station_id).first()
         if not station:
-            logger.warning(f"Station {station_name} not found in database")
-            return
-        
-        # Объединяем данные уровня воды и температуры по timestamp
-        measurements_by_time = {}
+            return None
         
-        # Process water level data
-        if data['water_level'] and data['timestamps']:
-            for timestamp, level in zip(data['timestamps'], data['water_level']):
-                if level is not None:  # Skip None values
-                    timestamp_str = timestamp.isoformat()
-                    if timestamp_str not in measurements_by_time:
-                        measurements_by_time[timestamp_str] = {'water_level': None, 'temperature': None}
-                    measurements_by_time[timestamp_str]['water_level'] = level
+        water_level_rows = measurement_rows(station, series.water_level)
+        temperature_rows = measurement_rows(station, series.temperature)
         
-        # Process temperature data
-        if data['temperature'] and data['timestamps']:
-            for timestamp, temp in zip(data['timestamps'], data['temperature']):
-                if temp is not None:  # Skip None values
-                    timestamp_str = timestamp.isoformat()
-                    if timestamp_str not in measurements_by_time:
-                        measurements_by_time[timestamp_str] = {'water_level': None, 'temperature': None}
-                    measurements_by_time[timestamp_str]['temperature'] = temp
+        # Дубликаты отсекает уникальный ключ (station_id, timestamp)
+        water_level_result = insert_measurements(db, models.WaterLevel, water_level_rows)
+        temperature_result = insert_measurements(db, models.Temperature, temperature_rows)
         
-        # Save measurements to database
-        water_level_count = 0
-        temperature_count = 0
-        
-        for timestamp_str, data in measurements_by_time.items():
-            timestamp = datetime.fromisoformat(timestamp_str)
-            # Применяем смещение времени станции (по умолчанию 0)
-            time_offset = station.time_offset or 0
-            timestamp_utc = timestamp + timedelta(seconds=time_offset)
-            
-            # Save water level if available
-            if data['water_level'] is not None:
-                # Check if measurement already exists
-                existing_water_level = db.query(models.WaterLevel).filter(
-                    models.WaterLevel.station_id == station.id,
-                    models.WaterLevel.timestamp == timestamp
-                ).first()
-                
-                if not existing_water_level:
-                    water_level = models.WaterLevel(
-                        station_id=station.id,
-                        timestamp=timestamp,
-                        timestamp_utc=timestamp_utc,
-                        value=data['water_level']
-                    )
-                    db.add(water_level)
-                    water_level_count += 1
-            
-            # Save temperature if available
-            if data['temperature'] is not None:
-                # Check if measurement already exists
-                existing_temperature = db.query(models.Temperature).filter(
-                    models.Temperature.station_id == station.id,
-                    models.Temperature.timestamp == timestamp
-                ).first()
-                
-                if not existing_temperature:
-                    temperature = models.Temperature(
-                        station_id=station.id,
-                        timestamp=timestamp,
-                        timestamp_utc=timestamp_utc,
-                        value=data['temperature']
-                    )
-                    db.add(temperature)
-                    temperature_count += 1
+        # Пересчитываем часовые и суточные агрегаты только для затронутых интервалов
+        for metric, result in (('water_level', water_level_result), ('temperature', temperature_result)):
+            if result.inserted:
+                refresh_rollups(db, station.id, metric, result.first_timestamp_utc, result.last_timestamp_utc)
         
         # Update station's last_updated timestamp
         station.last_updated = datetime.now()
         
         # Commit changes
         db.commit()
-        logger.info(f"Station {station_name}: Added {water_level_count} water levels and {temperature_count} temperatures")
+        return water_level_result, temperature_result
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def spool_page(station, days, page_text, spool=None):
+    """Store the fetched page in the spool before ingesting it, returns its reference or None
+
+    Запись с fsync выполняется в потоке, чтобы не останавливать цикл событий.
+    """
+    spool = spool or get_spool()
+    if spool is None:
+        return None
+    try:
+        return await asyncio.to_thread(
+            spool.append, station, generate_graph_url(station.code, station.name, days), days, page_text
+        )
+    except OSError as e:
+        # Без спула страница всё равно обрабатывается, как раньше
+        logger.error(f"Error spooling page of station {station.name}: {str(e)}")
+        return None
+
+async def mark_spooled(ref, failed=None, spool=None):
+    """Mark a spooled page as ingested, or quarantine it with the failure reason"""
+    if ref is None:
+        return
+    spool = spool or get_spool()
+    try:
+        if failed is None:
+            await asyncio.to_thread(spool.mark_ingested, ref)
+        else:
+            await asyncio.to_thread(spool.mark_failed, ref, failed)
+    except OSError as e:
+        # Данные уже в базе (или страница отброшена); без отметки запись лишь будет переиграна повторно
+        logger.error(f"Error marking spooled page {ref[0]}:{ref[1]}: {str(e)}")
+
+async def replay_spool():
+    """Ingest spooled pages left pending by failed writes, returns the total WriteResult
+
+    Свежие записи пропускаются: их ещё могут обрабатывать текущие опросы. Переигровка идёт пакетами,
+    пока остаются записи и пакет продвигается (при недоступной базе записи остаются до следующего прогона).
+    """
+    total = WriteResult()
+    spool = get_spool()
+    if spool is None:
+        return total
+    # Импорт здесь: ingest_pipeline сам использует функции этого модуля
+    from ingest_pipeline import IngestPipeline
+
+    older_than = time.time() - settings.ingest_spool_replay_after_seconds
+    previous = None
+    while True:
+        try:
+            records = await asyncio.to_thread(
+                spool.pending_records, older_than, settings.ingest_spool_replay_batch
+            )
+        except OSError as e:
+            logger.error(f"Error reading spool: {str(e)}")
+            break
+        if not records or records[0].ref == previous:
+            break
+        previous = records[0].ref
+        logger.info(f"Replaying {len(records)} pending spooled page(s)")
+        try:
+            total += await IngestPipeline(spool=spool).replay(records)
+        except Exception as e:
+            logger.error(f"Error replaying spool: {str(e)}")
+            break
+        if len(records) < settings.ingest_spool_replay_batch:
+            break
+    if total.inserted or total.skipped:
+        logger.info(f"Spool replay: {total.inserted} rows inserted, {total.skipped} skipped")
+    return total
+
+def prune_spool():
+    """Delete old spool segments without pending pages"""
+    spool = get_spool()
+    if spool is None:
+        return
+    try:
+        removed = spool.prune()
+        if removed:
+            logger.info(f"Pruned {len(removed)} spool segment(s)")
+    except OSError as e:
+        logger.error(f"Error pruning spool: {str(e)}")
+
+async def process_station(session, station, limiter, semaphore, on_series=None):
+    """Process single station and save its measurements to database
+
+    on_series(series) вызывается для каждой загруженной непустой страницы до отбора новых точек
+    (по ней планировщик оценивает период отправки данных станцией).
+    """
+    async with semaphore:
+        try:
+            days = choose_fetch_days(station.id)
+            logger.info(f"Fetching {days}d of data for station {station.name} ({station.code})...")
+            page_text = await fetch_station_page(
+                session,
+                station.code,
+                station.name,
+                days=days,
+                limiter=limiter,
+                timeout=settings.ingest_timeout_seconds,
+                retries=settings.ingest_retries,
+                backoff=settings.ingest_backoff_seconds
+            )
             
+            if page_text is UNCHANGED:
+                logger.info(f"Station {station.name}: page not changed since last fetch")
+                return WriteResult(), WriteResult()
+            
+            # Страница сначала записывается в спул: при сбое базы её можно переиграть
+            ref = await spool_page(station, days, page_text)
+            try:
+                series = parse_station_data(page_text)
+            except Exception as e:
+                # Страница не разбирается - повторная переигровка не поможет
+                await mark_spooled(ref, failed=f"parse error: {e}")
+                raise
+            if not series:
+                logger.warning(f"No data for station {station.name}")
+                await mark_spooled(ref)
+                return
+            if on_series is not None:
+                on_series(series)
+            
+            series = series.after(high_water_marks.get(station.id))
+            if not series:
+                logger.info(f"Station {station.name}: no new measurements")
+                await mark_spooled(ref)
+                return WriteResult(), WriteResult()
+            
+            # Запись в БД синхронная, поэтому выполняем её в потоке, не блокируя загрузку остальных станций
+            results = await asyncio.to_thread(save_station_data, station.id, series)
+            if results is None:
+                logger.warning(f"Station {station.name} not found in database")
+                await mark_spooled(ref, failed="station not found")
+                return
+            await mark_spooled(ref)
+            update_high_water_marks(station.id, series)
+            
+            water_level_result, temperature_result = results
+            logger.info(
+                f"Station {station.name}: Added {water_level_result.inserted} water levels "
+                f"({water_level_result.skipped} skipped) and {temperature_result.inserted} temperatures "
+                f"({temperature_result.skipped} skipped)"
+            )
+            return results
+                
+        except Exception as e:
+            # Страница не сохранена - при следующей загрузке её нужно обработать заново
+            fetch_cache.invalidate(station.code)
+            logger.error(f"Error processing station {station.name}: {str(e)}")
+
+def ensure_partitions():
+    """Create upcoming monthly partitions before writing new measurements"""
+    try:
+        for name, error in maintain_partitions(engine):
+            logger.error(f"Error creating {name}: {str(error)}")
     except Exception as e:
-        db.rollback()
-        logger.error(f"Error processing station {station_name}: {str(e)}")
+        logger.error(f"Error maintaining partitions: {str(e)}")
 
-async def update_all_stations():
-    """Update measurements for all stations"""
+async def update_all_stations(pipeline=None):
+    """Update measurements for all stations, returns the total WriteResult
+
+    pipeline - IngestPipeline для запуска (бенчмарки передают свой, чтобы прочитать статистику стадий).
+    """
+    await asyncio.to_thread(ensure_partitions)
+    
     db = SessionLocal()
     try:
         # Get all stations from database
         stations = db.query(models.Station).all()
-        
-        if not stations:
-            logger.warning("No stations found in the database")
-            return
-        
-        logger.info(f"Found {len(stations)} stations")
-        
-        # Process each station
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for station in stations:
-                task = asyncio.create_task(process_station(session, station.code, station.name, db))
-                tasks.append(task)
-            
-            # Wait for all tasks to complete
-            await asyncio.gather(*tasks)
-        
-        logger.info("Data update completed")
     finally:
         db.close()
+    
+    if not stations:
+        logger.warning("No stations found in the database")
+        return WriteResult()
+    
+    logger.info(f"Found {len(stations)} stations")
+    await asyncio.to_thread(load_high_water_marks, [station.id for station in stations])
+    started = time.monotonic()
+    cache_before = fetch_cache.stats()
+    
+    # Импорт здесь: ingest_pipeline сам использует функции этого модуля
+    from ingest_pipeline import IngestPipeline
+    total = await (pipeline or IngestPipeline()).run(stations)
+    
+    cache_after = fetch_cache.stats()
+    logger.info(
+        f"Data update completed in {time.monotonic() - started:.1f}s: "
+        f"{total.inserted} rows inserted, {total.skipped} skipped, "
+        f"fetch cache {cache_after['hits'] - cache_before['hits']} hits / "
+        f"{cache_after['misses'] - cache_before['misses']} misses"
+    )
+    return total
 
 if __name__ == "__main__":
-    asyncio.run(update_all_stations()) 
\ No newline at end of file
+    asyncio.run(update_all_stations())
@@ -0,0 +1,202 @@
+"""Synthetic dataset for API load tests: years of minute data for hundreds of stations
+
+Станции добавляются в stations, ряды уровня воды и температуры загружаются через COPY (по станции
+на процесс, порциями по месяцу) в заранее созданные месячные секции, затем пересчитываются агрегаты
+rollups_hourly / rollups_daily (тоже по станции на процесс и по месяцу на транзакцию) и выполняется
+ANALYZE; statement_timeout на этих соединениях отключается. Данные заканчиваются текущей минутой.
+
+База по умолчанию - waterlevel_bench (как у bench_ingest.py); --reset очищает таблицы перед загрузкой
+(в базе, в имени которой нет "bench", - только вместе с --force).
+
+Usage:
+    python scripts/generate_dataset.py --stations 300 --years 2 --reset
+    python scripts/generate_dataset.py --stations 20 --years 1 --step-minutes 10 --jobs 4
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+MINUTES_PER_YEAR = 525_960
+# Доля пропусков в рядах, как у реальных станций; пропущенные точки не записываются
+GAP_FRACTION = 0.01
+METRIC_TABLES = ("water_levels", "temperatures")
+
+
+def month_ranges(start, end):
+    """[start, end) split at month boundaries"""
+    current = start
+    while current < end:
+        following = datetime(current.year + current.month // 12, current.month % 12 + 1, 1)
+        yield current, min(following, end)
+        current = following
+
+
+def synthetic_values(rng, minutes, table, phase):
+    """Seasonal + daily cycle with noise; minutes - minutes since the epoch (int64 array)"""
+    year = 2 * np.pi * minutes / MINUTES_PER_YEAR + phase
+    day = 2 * np.pi * (minutes % 1440) / 1440
+    if table == "water_levels":
+        values = 150 + 60 * phase + 40 * np.sin(year) + 2 * np.sin(day) + rng.normal(0, 1.5, len(minutes))
+    else:
+        values = 10 + 8 * np.sin(year - 1.5) + 3 * np.sin(day - 2) + rng.normal(0, 0.3, len(minutes))
+    return np.round(values, 1)
+
+
+def copy_buffer(station_id, minutes, values):
+    """COPY text rows: station_id, timestamp, timestamp_utc, value (смещение станций - 0)"""
+    stamps = np.datetime_as_string(minutes.astype("datetime64[m]"), unit="s").tolist()
+    rows = [f"{station_id}\t{stamp}\t{stamp}\t{value}" for stamp, value in zip(stamps, values.tolist())]
+    return io.StringIO("\n".join(rows) + "\n")
+
+
+def _init_worker():
+    from app.database import get_engine
+
+    # Соединения пула родительского процесса не используются после fork
+    get_engine().dispose(close=False)
+
+
+def load_station(station_id, start, end, step_minutes, seed):
+    """COPY both series of one station month by month, returns the number of rows written"""
+    from app.database import get_engine
+
+    rng = np.random.default_rng(seed)
+    phase = rng.uniform(0, 1)
+    epoch = datetime(1970, 1, 1)
+    written = 0
+    connection = get_engine().raw_connection()
+    try:
+        cursor = connection.cursor()
+        for month_start, month_end in month_ranges(start, end):
+            first = int((month_start - epoch).total_seconds() // 60)
+            last = int((month_end - epoch).total_seconds() // 60)
+            minutes = np.arange(first + -first % step_minutes, last, step_minutes, dtype=np.int64)
+            for table in METRIC_TABLES:
+                values = synthetic_values(rng, minutes, table, phase)
+                # Как при загрузке (StationSeries.from_points отбрасывает NaN): пропуск - отсутствующая строка
+                kept = rng.random(len(minutes)) >= GAP_FRACTION
+                cursor.copy_expert(
+                    f"COPY {table} (station_id, timestamp, timestamp_utc, value) FROM STDIN",
+                    copy_buffer(station_id, minutes[kept], values[kept])
+                )
+                written += int(kept.sum())
+            connection.commit()
+        return written
+    finally:
+        connection.close()
+
+
+def rollup_station(station_id, start, end):
+    """Recompute the rollups of one station month by month, one transaction per month"""
+    from sqlalchemy.sql import text
+
+    from app.database import get_engine
+    from app.rollups import METRIC_TABLES as ROLLUP_METRICS, refresh_rollups
+
+    for month_start, month_end in month_ranges(start, end):
+        with get_engine().begin() as conn:
+            # Месяц минутных данных станции может не уложиться в statement_timeout из настроек
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+            for metric in ROLLUP_METRICS:
+                refresh_rollups(conn, station_id, metric, month_start, month_end - timedelta(microseconds=1))
+    return station_id
+
+
+def create_stations(count, last_updated):
+    """Insert count stations, returns their ids"""
+    from sqlalchemy.dialects.postgresql import insert
+
+    from app import models
+    from app.database import get_engine
+    from scrape_stations import generate_graph_url
+
+    rows = [
+        {
+            "name": f"Load station {i}",
+            "code": f"L{i:05d}",
+            "graph_url": generate_graph_url(f"L{i:05d}", f"Load station {i}"),
+            "river": f"River {i % 37}",
+            "region": "hidro",
+            "coordinates": f"{41.9 + (i % 100) / 100:.4f},{18.5 + (i // 100 % 100) / 100:.4f}",
+            "last_updated": last_updated,
+            "time_offset": 0,
+        }
+        for i in range(1, count + 1)
+    ]
+    with get_engine().begin() as conn:
+        return conn.execute(insert(models.Station).values(rows).returning(models.Station.id)).scalars().all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill the database with a large synthetic dataset')
+    parser.add_argument('--stations', type=int, default=300)
+    parser.add_argument('--years', type=float, default=2.0, help='Length of every series')
+    parser.add_argument('--step-minutes', type=int, default=1, help='Interval between points')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Parallel COPY processes')
+    parser.add_argument('--database', default='waterlevel_bench', help='Postgres database (created if missing)')
+    parser.add_argument('--reset', action='store_true', help='Empty the tables before loading')
+    parser.add_argument('--force', action='store_true', help='Allow --reset on a database that is not a *bench* one')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    # Настройки читаются при первом обращении: база задаётся до импорта модулей приложения
+    os.environ["POSTGRES_DB"] = args.database
+    from sqlalchemy.sql import text
+
+    from app.database import get_engine
+    from app.partitions import PARTITIONED_TABLES, create_partitions
+    from bench_ingest import prepare_database
+
+    end = datetime.utcnow().replace(second=0, microsecond=0)
+    start = end - timedelta(days=round(args.years * 365.25))
+    points = int((end - start).total_seconds() // 60 // args.step_minutes)
+    print(f"{args.stations} stations x {points} points x {len(METRIC_TABLES)} metrics, {start} .. {end}")
+
+    prepare_database(keep_data=not args.reset, force=args.force)
+    with get_engine().begin() as conn:
+        for table in PARTITIONED_TABLES:
+            create_partitions(conn, table, start.date(), end.date())
+
+    started = time.perf_counter()
+    station_ids = create_stations(args.stations, end)
+    written = 0
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker) as pool:
+        futures = [
+            pool.submit(load_station, station_id, start, end, args.step_minutes, args.seed * 100_003 + station_id)
+            for station_id in station_ids
+        ]
+        for done, future in enumerate(futures, 1):
+            written += future.result()
+            elapsed = time.perf_counter() - started
+            print(f"{done}/{len(futures)} stations, {written} rows, {written / elapsed:.0f} rows/s", flush=True)
+
+        copied = time.perf_counter()
+        futures = [
+            pool.submit(rollup_station, station_id, start, end + timedelta(minutes=1)) for station_id in station_ids
+        ]
+        for done, future in enumerate(futures, 1):
+            future.result()
+            print(f"{done}/{len(futures)} stations rolled up", flush=True)
+    rolled = time.perf_counter()
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SET statement_timeout = 0"))
+        for table in (*METRIC_TABLES, "rollups_hourly", "rollups_daily", "stations"):
+            conn.execute(text(f"ANALYZE {table}"))
+
+    print(
+        f"COPY {copied - started:.1f} s, rollups {rolled - copied:.1f} s, "
+        f"ANALYZE {time.perf_counter() - rolled:.1f} s; {written} rows"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlalchemy.sql import text
+
+from app.database import engine
+
+# Состояние хранится в отдельном модуле: при запуске `python fill_measurements.py` модуль загружается
+# дважды (__main__ и fill_measurements из ingest_pipeline), а отметки должны быть общими
+
+# Окна загрузки (параметр d= в aws-graph-h.php), от меньшего к большему
+FETCH_WINDOWS_DAYS = (1, 2, 3, 7, 14)
+FULL_FETCH_DAYS = 14
+# Запас к окну, чтобы не терять точки на границе интервала
+FETCH_WINDOW_MARGIN = timedelta(hours=1)
+
+# Последний сохранённый timestamp (epoch ms) по станциям: station_id -> {'water_level': ms, 'temperature': ms}
+# При старте заполняется из базы (load_high_water_marks), затем обновляется после каждой записи
+high_water_marks = {}
+
+# Последняя сохранённая точка каждой метрики по индексу (station_id, timestamp_utc); timestamp - время страницы
+HIGH_WATER_MARKS_SQL = """
+    SELECT s.id, wl.timestamp, t.timestamp
+    FROM stations s
+    LEFT JOIN LATERAL (
+        SELECT timestamp FROM water_levels WHERE station_id = s.id ORDER BY timestamp_utc DESC LIMIT 1
+    ) wl ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT timestamp FROM temperatures WHERE station_id = s.id ORDER BY timestamp_utc DESC LIMIT 1
+    ) t ON TRUE
+    WHERE s.id = ANY(:station_ids)
+"""
+
+
+def load_high_water_marks(station_ids):
+    """Fill high-water marks of stations not seen by this process yet from the latest stored rows"""
+    missing = [station_id for station_id in station_ids if station_id not in high_water_marks]
+    if not missing:
+        return
+    with engine.connect() as conn:
+        rows = conn.execute(text(HIGH_WATER_MARKS_SQL), {"station_ids": missing}).all()
+    for station_id, water_level, temperature in rows:
+        # timestamp хранится как datetime.fromtimestamp(ms / 1000), обратное преобразование - .timestamp()
+        high_water_marks.setdefault(station_id, {
+            'water_level': int(water_level.timestamp() * 1000) if water_level else None,
+            'temperature': int(temperature.timestamp() * 1000) if temperature else None,
+        })
+
+
+def choose_fetch_days(station_id, now_ms=None):
+    """Choose the smallest fetch window covering the gap since the station's high-water mark
+
+    Метрики, отстающие больше максимального окна (датчик перестал передавать данные), не учитываются:
+    полная загрузка их всё равно не догонит, а станция из-за них загружала бы 14 дней каждый раз.
+    """
+    now_ms = now_ms or time.time() * 1000
+    full_window_ms = FULL_FETCH_DAYS * 86_400_000
+    marks = [
+        mark for mark in high_water_marks.get(station_id, {}).values()
+        if mark is not None and now_ms - mark <= full_window_ms
+    ]
+    if not marks:
+        return FULL_FETCH_DAYS
+
+    gap = timedelta(milliseconds=now_ms - min(marks)) + FETCH_WINDOW_MARGIN
+    for days in FETCH_WINDOWS_DAYS:
+        if gap <= timedelta(days=days):
+            return days
+    # После длительного простоя загружаем максимальное окно
+    return FULL_FETCH_DAYS
+
+
+def update_high_water_marks(station_id, series):
+    """Remember the latest stored timestamp per metric for the station"""
+    marks = high_water_marks.setdefault(station_id, {'water_level': None, 'temperature': None})
+    for metric, latest in series.latest().items():
+        if latest is not None and (marks[metric] is None or latest > marks[metric]):
+            marks[metric] = latest
@@ -0,0 +1,344 @@
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import aiohttp
+
+# Добавляем родительскую директорию в путь поиска модулей
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+from app.rollups import refresh_rollups
+from app.logging_config import setup_logging
+from fetch_cache import UNCHANGED, fetch_cache
+from fetcher import HostRateLimiter
+from fill_measurements import mark_spooled, measurement_rows, save_station_data, spool_page
+from high_water import choose_fetch_days, high_water_marks, update_high_water_marks
+from ingest_writer import WriteResult, insert_measurements_by_station
+from payload_spool import get_spool
+from scrape_stations import fetch_station_page, parse_station_data
+
+logger = setup_logging("scheduler")
+
+# Конец потока в очереди между стадиями
+_DONE = object()
+
+
+class StageStats:
+    """Throughput of one pipeline stage: items, points and time the workers were busy"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.points = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def record(self, busy_seconds, items=1, points=0):
+        self.items += items
+        self.points += points
+        self.busy_seconds += busy_seconds
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def to_dict(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            "items": self.items,
+            "points": self.points,
+            "errors": self.errors,
+            "elapsed_seconds": round(elapsed, 3),
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items_per_second": round(self.items / elapsed, 1) if elapsed else None,
+            "points_per_second": round(self.points / elapsed, 1) if elapsed else None,
+        }
+
+    def summary(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return (
+            f"{self.name}: {self.items} items, {self.points} points, {self.errors} errors in {elapsed:.1f}s "
+            f"({self.items / elapsed if elapsed else 0:.1f} items/s, {self.points / elapsed if elapsed else 0:.0f} points/s, "
+            f"busy {self.busy_seconds:.1f}s)"
+        )
+
+
+def save_station_batch(items):
+    """Write new measurements of several stations in one transaction
+
+    items - список (station, series); возвращает station_id -> (water_level_result, temperature_result).
+    """
+    db = SessionLocal()
+    try:
+        results = {}
+        stations = {station.id: station for station, _ in items}
+        for metric, model in (('water_level', models.WaterLevel), ('temperature', models.Temperature)):
+            rows = []
+            for station, series in items:
+                rows.extend(measurement_rows(station, series.metric(metric)))
+            by_station = insert_measurements_by_station(db, model, rows)
+            for station_id in stations:
+                result = by_station.get(station_id, WriteResult())
+                results.setdefault(station_id, []).append(result)
+                if result.inserted:
+                    refresh_rollups(db, station_id, metric, result.first_timestamp_utc, result.last_timestamp_utc)
+
+        now = datetime.now()
+        db.query(models.Station).filter(models.Station.id.in_(list(stations))).update(
+            {models.Station.last_updated: now}, synchronize_session=False
+        )
+        db.commit()
+        return {station_id: tuple(pair) for station_id, pair in results.items()}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class IngestPipeline:
+    """Full network refresh as three overlapping stages connected by bounded queues
+
+    Загрузка (корутины aiohttp) -> разбор страниц (ProcessPoolExecutor) -> запись пакетами станций
+    (потоки с синхронными сессиями). Заполненная очередь приостанавливает предыдущую стадию.
+    Загруженные страницы сначала сохраняются в спул и отмечаются в нём после записи в базу.
+    """
+
+    def __init__(self, fetch_workers=None, parse_workers=None, write_workers=None, queue_size=None, write_batch=None,
+                 spool=None):
+        self.fetch_workers = fetch_workers or settings.ingest_fetch_workers or settings.ingest_concurrency
+        self.parse_workers = parse_workers or settings.ingest_parse_workers or os.cpu_count() or 1
+        self.write_workers = write_workers or settings.ingest_write_workers
+        self.queue_size = queue_size or settings.ingest_queue_size
+        self.write_batch = write_batch or settings.ingest_write_batch_stations
+        self.spool = spool if spool is not None else get_spool()
+        self.stats = {name: StageStats(name) for name in ('fetch', 'parse', 'write')}
+        self.total = WriteResult()
+        # При переигровке спула точки не отсекаются по high-water marks: дубликаты отбрасывает база
+        self.only_new = True
+
+    async def _spool(self, station, days, page_text):
+        if self.spool is None:
+            return None
+        return await spool_page(station, days, page_text, spool=self.spool)
+
+    async def _mark(self, ref, failed=None):
+        await mark_spooled(ref, failed=failed, spool=self.spool)
+
+    async def _fetch_worker(self, session, limiter, stations, pages):
+        stats = self.stats['fetch']
+        while True:
+            station = await stations.get()
+            if station is _DONE:
+                return
+            started = time.monotonic()
+            days = choose_fetch_days(station.id)
+            try:
+                page_text = await fetch_station_page(
+                    session,
+                    station.code,
+                    station.name,
+                    days=days,
+                    limiter=limiter,
+                    timeout=settings.ingest_timeout_seconds,
+                    retries=settings.ingest_retries,
+                    backoff=settings.ingest_backoff_seconds
+                )
+            except Exception as e:
+                stats.errors += 1
+                logger.error(f"Error fetching station {station.name}: {str(e)}")
+                continue
+            stats.record(time.monotonic() - started)
+            if page_text is UNCHANGED:
+                logger.info(f"Station {station.name}: page not changed since last fetch")
+                continue
+            await pages.put((station, page_text, await self._spool(station, days, page_text)))
+
+    async def _parse_worker(self, pool, pages, parsed):
+        stats = self.stats['parse']
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await pages.get()
+            if item is _DONE:
+                return
+            station, page_text, ref = item
+            started = time.monotonic()
+            try:
+                series = await loop.run_in_executor(pool, parse_station_data, page_text)
+            except Exception as e:
+                stats.errors += 1
+                fetch_cache.invalidate(station.code)
+                logger.error(f"Error parsing station {station.name}: {str(e)}")
+                await self._mark(ref, failed=f"parse error: {e}")
+                continue
+            try:
+                stats.record(time.monotonic() - started, points=series.point_count())
+                if not series:
+                    logger.warning(f"No data for station {station.name}")
+                    await self._mark(ref)
+                    continue
+                if self.only_new:
+                    series = series.after(high_water_marks.get(station.id))
+            except Exception as e:
+                # Ошибка одной станции не должна останавливать обработчик стадии
+                stats.errors += 1
+                fetch_cache.invalidate(station.code)
+                logger.error(f"Error processing station {station.name}: {str(e)}")
+                continue
+            if not series:
+                logger.info(f"Station {station.name}: no new measurements")
+                await self._mark(ref)
+                continue
+            await parsed.put((station, series, ref))
+
+    def _write(self, items):
+        """Write a batch; if the shared transaction fails, stations are retried one by one"""
+        try:
+            return save_station_batch(items)
+        except Exception as e:
+            logger.error(f"Batch write of {len(items)} stations failed, writing separately: {str(e)}")
+        results = {}
+        for station, series in items:
+            try:
+                results[station.id] = save_station_data(station.id, series)
+            except Exception as e:
+                fetch_cache.invalidate(station.code)
+                logger.error(f"Error saving station {station.name}: {str(e)}")
+        return results
+
+    async def _write_worker(self, parsed):
+        stats = self.stats['write']
+        done = False
+        while not done:
+            items = []
+            item = await parsed.get()
+            # Забираем уже готовые станции, не дожидаясь заполнения пакета
+            while True:
+                if item is _DONE:
+                    done = True
+                    break
+                items.append(item)
+                if len(items) >= self.write_batch or parsed.empty():
+                    break
+                item = parsed.get_nowait()
+            if not items:
+                continue
+
+            started = time.monotonic()
+            try:
+                results = await asyncio.to_thread(self._write, [(station, series) for station, series, _ in items])
+            except Exception as e:
+                stats.errors += len(items)
+                logger.error(f"Error writing a batch of {len(items)} stations: {str(e)}")
+                continue
+            written = 0
+            for station, series, ref in items:
+                try:
+                    if station.id not in results:
+                        # Ошибка записи: страница остаётся в спуле для переигровки
+                        stats.errors += 1
+                        continue
+                    station_results = results[station.id]
+                    if station_results is None:
+                        stats.errors += 1
+                        logger.warning(f"Station {station.name} not found in database")
+                        await self._mark(ref, failed="station not found")
+                        continue
+                    await self._mark(ref)
+                    update_high_water_marks(station.id, series)
+                    water_level_result, temperature_result = station_results
+                    written += water_level_result.inserted + temperature_result.inserted
+                    self.total += water_level_result
+                    self.total += temperature_result
+                except Exception as e:
+                    stats.errors += 1
+                    logger.error(f"Error finishing station {station.name}: {str(e)}")
+            stats.record(time.monotonic() - started, items=len(items), points=written)
+
+    async def _stage(self, workers, stats, downstream, count):
+        """Wait for a stage's workers, then signal the end of stream to the next stage
+
+        Конец потока передаётся и при ошибке обработчика, иначе следующие стадии ждали бы его вечно.
+        """
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            stats.finish()
+            if downstream is not None:
+                for _ in range(count):
+                    await downstream.put(_DONE)
+
+    async def _run(self, feed_workers, pages):
+        """Run the feed stage (fetch or spool reader) with the parse and write stages"""
+        parsed = asyncio.Queue(maxsize=self.queue_size)
+        logger.info(
+            f"Ingest pipeline: {len(feed_workers)} fetch, {self.parse_workers} parse processes, "
+            f"{self.write_workers} write workers, queues of {self.queue_size}"
+        )
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+            await asyncio.gather(
+                self._stage(feed_workers, self.stats['fetch'], pages, self.parse_workers),
+                self._stage(
+                    [self._parse_worker(pool, pages, parsed) for _ in range(self.parse_workers)],
+                    self.stats['parse'], parsed, self.write_workers
+                ),
+                self._stage(
+                    [self._write_worker(parsed) for _ in range(self.write_workers)],
+                    self.stats['write'], None, 0
+                ),
+            )
+
+        for stats in self.stats.values():
+            logger.info(stats.summary())
+        return self.total
+
+    async def run(self, stations):
+        """Fetch, parse and store new measurements for the stations, returns the total WriteResult"""
+        station_queue = asyncio.Queue()
+        pages = asyncio.Queue(maxsize=self.queue_size)
+        for station in stations:
+            station_queue.put_nowait(station)
+        for _ in range(self.fetch_workers):
+            station_queue.put_nowait(_DONE)
+
+        limiter = HostRateLimiter(settings.ingest_requests_per_second)
+        connector = aiohttp.TCPConnector(limit=self.fetch_workers)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            return await self._run(
+                [self._fetch_worker(session, limiter, station_queue, pages) for _ in range(self.fetch_workers)],
+                pages
+            )
+
+    async def _spool_reader(self, records, stations, pages):
+        stats = self.stats['fetch']
+        for record in records:
+            station = stations.get(record.station_id)
+            if station is None:
+                stats.errors += 1
+                logger.warning(f"Spooled page of unknown station {record.station_id} quarantined")
+                await self._mark(record.ref, failed="station not found")
+                continue
+            stats.record(0.0)
+            await pages.put((station, record.page, record.ref))
+
+    async def replay(self, records):
+        """Re-ingest spooled pages (SpoolRecord iterable) in bulk, returns the total WriteResult"""
+        self.only_new = False
+        stations = await asyncio.to_thread(load_stations)
+        pages = asyncio.Queue(maxsize=self.queue_size)
+        return await self._run([self._spool_reader(records, stations, pages)], pages)
+
+
+def load_stations():
+    """All stations by id"""
+    db = SessionLocal()
+    try:
+        return {station.id: station for station in db.query(models.Station).all()}
+    finally:
+        db.close()
@@ -0,0 +1,84 @@
+import sys
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.dialects.postgresql import insert
+
+# Добавляем родительскую директорию в путь поиска модулей
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import models
+
+# Строк в одном INSERT: 4 параметра на строку, лимит PostgreSQL - 65535 параметров
+BATCH_SIZE = 5000
+
+
+@dataclass
+class WriteResult:
+    inserted: int = 0
+    skipped: int = 0
+    # Диапазон timestamp_utc вставленных строк - по нему обновляются агрегаты
+    first_timestamp_utc: Optional[datetime] = None
+    last_timestamp_utc: Optional[datetime] = None
+
+    def __add__(self, other):
+        firsts = [ts for ts in (self.first_timestamp_utc, other.first_timestamp_utc) if ts is not None]
+        lasts = [ts for ts in (self.last_timestamp_utc, other.last_timestamp_utc) if ts is not None]
+        return WriteResult(
+            self.inserted + other.inserted,
+            self.skipped + other.skipped,
+            min(firsts) if firsts else None,
+            max(lasts) if lasts else None,
+        )
+
+
+def insert_measurements(db, model, rows):
+    """Insert measurement rows in batches, skipping rows already stored for (station_id, timestamp)
+
+    rows - список словарей с ключами station_id, timestamp, timestamp_utc, value
+    """
+    result = WriteResult()
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        stmt = (
+            insert(model)
+            .values(batch)
+            .on_conflict_do_nothing()
+            .returning(model.timestamp_utc)
+        )
+        inserted = db.execute(stmt).scalars().all()
+        result += WriteResult(
+            len(inserted),
+            len(batch) - len(inserted),
+            min(inserted) if inserted else None,
+            max(inserted) if inserted else None,
+        )
+    return result
+
+
+def insert_measurements_by_station(db, model, rows):
+    """Insert rows of several stations in shared batches, returns station_id -> WriteResult"""
+    offered = {}
+    for row in rows:
+        offered[row['station_id']] = offered.get(row['station_id'], 0) + 1
+    inserted = {station_id: [] for station_id in offered}
+    for start in range(0, len(rows), BATCH_SIZE):
+        stmt = (
+            insert(model)
+            .values(rows[start:start + BATCH_SIZE])
+            .on_conflict_do_nothing()
+            .returning(model.station_id, model.timestamp_utc)
+        )
+        for station_id, timestamp_utc in db.execute(stmt).all():
+            inserted[station_id].append(timestamp_utc)
+    return {
+        station_id: WriteResult(
+            len(inserted[station_id]),
+            count - len(inserted[station_id]),
+            min(inserted[station_id]) if inserted[station_id] else None,
+            max(inserted[station_id]) if inserted[station_id] else None,
+        )
+        for station_id, count in offered.items()
+    }
+
@@ -4,11 +4,20 @@ import sys
 # Add the project root directory to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from sqlalchemy.sql import text
+
 from app.database import engine
 from app.models import Base
+from app.partitions import PARTITIONED_TABLES, maintain_partitions
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for table in PARTITIONED_TABLES:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT;"))
+    # Секции от начала окна полной загрузки, чтобы первая загрузка не попала в DEFAULT
+    for name, error in maintain_partitions(engine):
+        print(f"Error creating {name}: {error}")
 
 if __name__ == "__main__":
     init_db()
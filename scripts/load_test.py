@@ -0,0 +1,262 @@
+"""Async load driver for the API with a realistic request mix
+
+Запросы отправляются из --concurrency параллельных корутин в течение --duration секунд; вид запроса
+выбирается случайно по весам MIX. Интервалы дат смещаются случайно, чтобы запросы не обслуживались
+только кэшем ответов (--cacheable округляет их до часа). Для подсчёта запросов к базе API должен быть
+запущен с DB_QUERY_COUNT_HEADER=true - значения берутся из заголовка X-DB-Queries.
+
+Результат - JSON с задержками p50/p95/p99, пропускной способностью и числом запросов к базе по видам
+запросов; --compare печатает изменения относительно предыдущего результата.
+
+Usage:
+    python scripts/generate_dataset.py --stations 300 --years 2 --reset
+    DB_QUERY_COUNT_HEADER=true POSTGRES_DB=waterlevel_bench uvicorn app.main:app --workers 4
+    python scripts/load_test.py --duration 60 --concurrency 32 --json before.json
+    python scripts/load_test.py --duration 60 --concurrency 32 --json after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import aiohttp
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.pagination import encode_cursor
+
+# См. app/query_stats.py; модуль не импортируется, чтобы драйверу не требовались зависимости API
+QUERY_COUNT_HEADER = "X-DB-Queries"
+
+# Вид запроса -> вес в смеси
+MIX = {
+    "stations": 10,
+    "station": 5,
+    "latest": 10,
+    "water_levels_24h": 20,
+    "series_24h": 10,
+    "water_levels_14d_page": 10,
+    "series_14d_max_points": 10,
+    "aggregates_1y_daily": 8,
+    "water_levels_1y_max_points": 5,
+    "water_levels_deep_cursor": 6,
+    "temperatures_deep_offset": 6,
+}
+PERCENTILES = (50, 95, 99)
+
+
+def isoformat(moment):
+    return moment.replace(microsecond=0).isoformat()
+
+
+class RequestMix:
+    """Builds request paths of each kind for random stations and date ranges"""
+
+    def __init__(self, station_ids, now, rng, cacheable=False, history_days=365):
+        self.station_ids = station_ids
+        self.now = now
+        self.rng = rng
+        self.cacheable = cacheable
+        self.history_days = history_days
+        self.kinds = list(MIX)
+        self.weights = [MIX[kind] for kind in self.kinds]
+
+    def end(self):
+        # Конец интервала в пределах последних суток; с --cacheable - по часам
+        end = self.now - timedelta(minutes=self.rng.randrange(24 * 60))
+        if self.cacheable:
+            end = end.replace(minute=0, second=0)
+        return end
+
+    def ranged(self, days):
+        end = self.end()
+        return f"start_date={isoformat(end - timedelta(days=days))}&end_date={isoformat(end)}"
+
+    def next(self):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        station = self.rng.choice(self.station_ids)
+        if kind == "stations":
+            path = "/stations/?limit=1000"
+        elif kind == "station":
+            path = f"/stations/{station}"
+        elif kind == "latest":
+            path = "/stations/latest"
+        elif kind == "water_levels_24h":
+            path = f"/stations/{station}/water-levels/?{self.ranged(1)}&limit=2000"
+        elif kind == "series_24h":
+            path = f"/stations/{station}/series?{self.ranged(1)}&limit=2000"
+        elif kind == "water_levels_14d_page":
+            path = f"/stations/{station}/water-levels/?{self.ranged(14)}&limit=1000"
+        elif kind == "series_14d_max_points":
+            path = f"/stations/{station}/series?{self.ranged(14)}&max_points=1000"
+        elif kind == "aggregates_1y_daily":
+            path = f"/stations/{station}/aggregates/?resolution=day&{self.ranged(365)}"
+        elif kind == "water_levels_1y_max_points":
+            path = f"/stations/{station}/water-levels/?{self.ranged(365)}&max_points=2000"
+        elif kind == "water_levels_deep_cursor":
+            # Курсор на случайную точку глубоко в истории: keyset-страница в старых секциях
+            position = self.now - timedelta(minutes=self.rng.randrange(self.history_days * 24 * 60))
+            path = f"/stations/{station}/water-levels/?cursor={encode_cursor(position.replace(microsecond=0), 0)}&limit=1000"
+        else:
+            offset = self.rng.randrange(0, 100_000, 1000)
+            path = f"/stations/{station}/temperatures/?{self.ranged(365)}&skip={offset}&limit=1000"
+        return kind, path
+
+
+class EndpointStats:
+    """Latencies, statuses, bytes and DB query counts of one request kind"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+        self.bytes = 0
+        self.db_queries = []
+
+    def record(self, latency, status, size, db_queries):
+        self.latencies.append(latency)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if status is None or status >= 400:
+            self.errors += 1
+        self.bytes += size
+        if db_queries is not None:
+            self.db_queries.append(db_queries)
+
+    def to_dict(self, elapsed):
+        latencies = sorted(self.latencies)
+        result = {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "statuses": self.statuses,
+            "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+            "mean_ms": round(1000 * sum(latencies) / len(latencies), 2) if latencies else None,
+            "bytes": self.bytes,
+            "db_queries_mean": round(sum(self.db_queries) / len(self.db_queries), 2) if self.db_queries else None,
+            "db_queries_max": max(self.db_queries) if self.db_queries else None,
+        }
+        for p in PERCENTILES:
+            result[f"p{p}_ms"] = round(1000 * percentile(latencies, p), 2) if latencies else None
+        return result
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of a sorted list"""
+    index = max(0, min(len(ordered) - 1, -(-p * len(ordered) // 100) - 1))
+    return ordered[index]
+
+
+async def worker(session, base_url, mix, stats, deadline, timeout):
+    while time.monotonic() < deadline:
+        kind, path = mix.next()
+        started = time.perf_counter()
+        status, size, db_queries = None, 0, None
+        try:
+            async with session.get(base_url + path, timeout=timeout) as response:
+                body = await response.read()
+                status, size = response.status, len(body)
+                if QUERY_COUNT_HEADER in response.headers:
+                    db_queries = int(response.headers[QUERY_COUNT_HEADER])
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        stats.setdefault(kind, EndpointStats()).record(time.perf_counter() - started, status, size, db_queries)
+
+
+async def run(args):
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    headers = {"Accept-Encoding": args.accept_encoding} if args.accept_encoding else {}
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+        async with session.get(args.base_url + "/stations/?limit=100000", timeout=timeout) as response:
+            response.raise_for_status()
+            station_ids = [station["id"] for station in await response.json()]
+        if not station_ids:
+            sys.exit("No stations: fill the database with scripts/generate_dataset.py first")
+
+        mix = RequestMix(station_ids, datetime.utcnow(), random.Random(args.seed), args.cacheable, args.history_days)
+        stats = {}
+        if args.warmup:
+            await asyncio.gather(*[
+                worker(session, args.base_url, mix, {}, time.monotonic() + args.warmup, timeout)
+                for _ in range(args.concurrency)
+            ])
+        started = time.monotonic()
+        await asyncio.gather(*[
+            worker(session, args.base_url, mix, stats, started + args.duration, timeout)
+            for _ in range(args.concurrency)
+        ])
+        elapsed = time.monotonic() - started
+
+    total = EndpointStats()
+    for endpoint in stats.values():
+        total.latencies += endpoint.latencies
+        total.errors += endpoint.errors
+        for status, count in endpoint.statuses.items():
+            total.statuses[status] = total.statuses.get(status, 0) + count
+        total.bytes += endpoint.bytes
+        total.db_queries += endpoint.db_queries
+    return {
+        "config": {
+            "base_url": args.base_url,
+            "duration_seconds": args.duration,
+            "concurrency": args.concurrency,
+            "stations": len(station_ids),
+            "cacheable": args.cacheable,
+            "accept_encoding": args.accept_encoding,
+            "seed": args.seed,
+            "started_at": datetime.utcnow().isoformat(),
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "total": total.to_dict(elapsed),
+        "endpoints": {kind: stats[kind].to_dict(elapsed) for kind in MIX if kind in stats},
+    }
+
+
+def print_report(report, baseline=None):
+    columns = ("requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "db_queries_mean")
+    print(f"{'':>28} " + " ".join(f"{column:>15}" for column in columns))
+    rows = [("total", report["total"])] + list(report["endpoints"].items())
+    for name, result in rows:
+        cells = []
+        for column in columns:
+            value = result[column]
+            previous = None
+            if baseline is not None:
+                previous = (baseline["total"] if name == "total" else baseline["endpoints"].get(name, {})).get(column)
+            if value is not None and previous:
+                cells.append(f"{value:>8} {100 * (value - previous) / previous:+5.0f}%")
+            else:
+                cells.append(f"{'-' if value is None else value:>15}")
+        print(f"{name:>28} " + " ".join(f"{cell:>15}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API load test with a realistic request mix')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--duration', type=float, default=60.0, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=5.0, help='Seconds of unmeasured requests before the run')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--history-days', type=int, default=365, help='How deep cursor pages may point')
+    parser.add_argument('--cacheable', action='store_true', help='Round date ranges to the hour (response cache hits)')
+    parser.add_argument('--accept-encoding', default='gzip', help='Accept-Encoding header, empty for identity')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--compare', help='Previous results (JSON) to print changes against')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import json
+import re
+
+import numpy as np
+
+# Объявления нужных переменных на странице графика и на странице списка станций
+_JS_VAR_RE = re.compile(r'var\s+(Data_m|Data_h|staniceH)\s*=\s*\{')
+# Ключи внутри Data_m / Data_h: группы графиков (G1, G2, ...) и ряды V (уровень) / Tv (температура)
+_SERIES_KEY_RE = re.compile(r'["\']?\b(G\d+|Tv|V)\b["\']?\s*:\s*')
+_ARRAY_END_RE = re.compile(r'\]\s*,?\s*\]')
+# Скобки и кавычки внутри массива точек не нужны для разбора чисел
+_STRIP_TABLE = str.maketrans({'[': ' ', ']': ' ', '"': ' ', "'": ' '})
+
+
+def preprocess_js_object(js_str):
+    # Remove any trailing commas before closing braces/brackets
+    js_str = re.sub(r',(\s*[}\]])', r'\1', js_str)
+    # Replace single quotes with double quotes for JSON compatibility
+    js_str = re.sub(r"'", '"', js_str)
+    # Remove any comments
+    js_str = re.sub(r'//.*?\n', '\n', js_str)
+    # Add quotes around property names
+    js_str = re.sub(r'([{,])\s*([a-zA-Z0-9_]+)\s*:', r'\1"\2":', js_str)
+    return js_str
+
+
+def find_js_objects(page_text):
+    """Locate Data_m, Data_h and staniceH object literals in one pass, returns name -> (start, end)"""
+    objects = {}
+    for match in _JS_VAR_RE.finditer(page_text):
+        name = match.group(1)
+        if name in objects:
+            continue
+        start = match.end() - 1
+        end = page_text.find('};', start)
+        if end == -1:
+            continue
+        objects[name] = (start, end + 1)
+    return objects
+
+
+def decode_points(array_text):
+    """Decode a JS array of [epoch_ms, value] pairs into int64 timestamps and float64 values (NaN for null)"""
+    parts = [
+        part for part in array_text.translate(_STRIP_TABLE).replace('null', 'nan').split(',')
+        if not part.isspace() and part
+    ]
+    if len(parts) % 2:
+        raise ValueError("Series array is not a list of [timestamp, value] pairs")
+    flat = np.array(parts, dtype=np.float64)
+    return flat[0::2].astype(np.int64), flat[1::2]
+
+
+def extract_series(page_text, start, end, group='G1'):
+    """Extract V and Tv arrays of one chart group from an object literal, returns metric -> (timestamps, values)"""
+    series = {}
+    current_group = None
+    pos = start
+    while True:
+        match = _SERIES_KEY_RE.search(page_text, pos, end)
+        if match is None:
+            break
+        key = match.group(1)
+        pos = match.end()
+        if key[0] == 'G':
+            current_group = key
+            continue
+        if current_group != group or not page_text.startswith('[', pos):
+            continue
+        array_end = _ARRAY_END_RE.search(page_text, pos, end)
+        inner_end = page_text.find(']', pos + 1, end)
+        if inner_end != -1 and not page_text[pos + 1:inner_end].strip():
+            # Пустой массив []
+            series[key] = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+            pos = inner_end + 1
+            continue
+        if array_end is None:
+            break
+        series[key] = decode_points(page_text[pos:array_end.end()])
+        pos = array_end.end()
+    return series
+
+
+def parse_graph_page(page_text):
+    """Parse aws-graph-h.php page into {'V': (timestamps, values), 'Tv': (...)}
+
+    Минутные данные (Data_m) имеют приоритет, часовые (Data_h) используются, только если минутных нет.
+    Returns an empty dict when neither object holds both series.
+    """
+    objects = find_js_objects(page_text)
+    for name in ('Data_m', 'Data_h'):
+        if name not in objects:
+            continue
+        try:
+            series = extract_series(page_text, *objects[name])
+        except ValueError as e:
+            print(f"Error parsing {name}: {e}")
+            continue
+        if 'V' in series and 'Tv' in series and (len(series['V'][0]) or len(series['Tv'][0])):
+            return series
+    return {}
+
+
+def parse_stations_page(page_text):
+    """Parse staniceH object from aws_h.php page, returns None if it is missing"""
+    objects = find_js_objects(page_text)
+    if 'staniceH' not in objects:
+        return None
+    start, end = objects['staniceH']
+    return json.loads(preprocess_js_object(page_text[start:end]))
@@ -0,0 +1,272 @@
+"""Durable append-only spool of fetched station pages
+
+Каждая загруженная страница сначала дописывается в сегмент спула на диске (zlib-сжатая JSON-запись
+с префиксом длины, fsync), и только затем разбирается и записывается в базу. После успешной записи
+смещение записи добавляется в файл <сегмент>.done. Страницы, которые невозможно загрузить (ошибка
+разбора, неизвестная станция), отмечаются в <сегмент>.failed и не переигрываются повторно; при удалении
+сегмента они сохраняются в quarantine/. Записи без отметок (сбой записи в базу) переигрывает планировщик
+при обслуживании спула; вручную - командой replay.
+
+Usage:
+    python scripts/payload_spool.py stats
+    python scripts/payload_spool.py replay              # дозагрузка неразобранных страниц после сбоя
+    python scripts/payload_spool.py replay --all        # переигровка всего спула
+    python scripts/payload_spool.py replay --failed     # повтор страниц из карантина (после исправления)
+    python scripts/payload_spool.py export corpus/      # страницы как *.html для bench_parser.py --pages
+    python scripts/payload_spool.py prune               # удаление полностью загруженных старых сегментов
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import NamedTuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.config import settings
+
+SEGMENT_SUFFIX = ".spool"
+DONE_SUFFIX = ".done"
+FAILED_SUFFIX = ".failed"
+QUARANTINE_DIR = "quarantine"
+# Длина сжатой записи перед самой записью
+_LENGTH = struct.Struct(">I")
+
+
+class SpoolRecord(NamedTuple):
+    segment: str
+    offset: int
+    station_id: int
+    station_code: str
+    station_name: str
+    url: str
+    days: int
+    fetched_at: float
+    page: str
+
+    @property
+    def ref(self):
+        return self.segment, self.offset
+
+
+class PayloadSpool:
+    """Hourly segment files per process; records are appended and fsynced before ingestion"""
+
+    def __init__(self, directory, fsync=True, retention_days=14, compression_level=6):
+        self.directory = directory
+        self.fsync = fsync
+        self.retention_days = retention_days
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_path(self, now=None):
+        hour = (now or datetime.now(timezone.utc)).strftime("%Y%m%d%H")
+        # pid в имени: несколько процессов никогда не пишут в один сегмент
+        return os.path.join(self.directory, f"payloads-{hour}-{os.getpid()}{SEGMENT_SUFFIX}")
+
+    def _write(self, path, data):
+        with open(path, "ab") as f:
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def append(self, station, url, days, page):
+        """Durably store a fetched page, returns the record reference (segment, offset)"""
+        record = {
+            "station_id": station.id,
+            "station_code": station.code,
+            "station_name": station.name,
+            "url": url,
+            "days": days,
+            "fetched_at": time.time(),
+            "page": page,
+        }
+        blob = zlib.compress(json.dumps(record, ensure_ascii=False).encode("utf-8"), self.compression_level)
+        with self._lock:
+            path = self._segment_path()
+            offset = os.path.getsize(path) if os.path.exists(path) else 0
+            self._write(path, _LENGTH.pack(len(blob)) + blob)
+        return os.path.basename(path), offset
+
+    def mark_ingested(self, ref):
+        segment, offset = ref
+        with self._lock:
+            self._write(os.path.join(self.directory, segment + DONE_SUFFIX), f"{offset}\n".encode())
+
+    def mark_failed(self, ref, reason):
+        """Quarantine a record that cannot be ingested: it is no longer pending and does not block prune"""
+        segment, offset = ref
+        reason = " ".join(str(reason).split())
+        with self._lock:
+            self._write(os.path.join(self.directory, segment + FAILED_SUFFIX), f"{offset}\t{reason}\n".encode())
+
+    def segments(self):
+        return sorted(os.path.basename(path) for path in glob.glob(os.path.join(self.directory, "*" + SEGMENT_SUFFIX)))
+
+    def _marked_offsets(self, segment, suffix):
+        path = os.path.join(self.directory, segment + suffix)
+        if not os.path.exists(path):
+            return set()
+        with open(path, encoding="utf-8") as f:
+            return {int(line.split("\t", 1)[0]) for line in f if line.strip()}
+
+    def ingested_offsets(self, segment):
+        return self._marked_offsets(segment, DONE_SUFFIX)
+
+    def failed_offsets(self, segment):
+        return self._marked_offsets(segment, FAILED_SUFFIX)
+
+    def read_segment(self, segment):
+        """Records of a segment in append order; a torn record at the end (crash while writing) is ignored"""
+        with open(os.path.join(self.directory, segment), "rb") as f:
+            while True:
+                offset = f.tell()
+                header = f.read(_LENGTH.size)
+                if len(header) < _LENGTH.size:
+                    return
+                (length,) = _LENGTH.unpack(header)
+                blob = f.read(length)
+                if len(blob) < length:
+                    return
+                try:
+                    record = json.loads(zlib.decompress(blob))
+                except (zlib.error, ValueError):
+                    return
+                yield SpoolRecord(segment=segment, offset=offset, **record)
+
+    def records(self, pending_only=False, failed_only=False):
+        """Records oldest segment first: all, pending (neither ingested nor quarantined) or quarantined only"""
+        filtered = pending_only or failed_only
+        for segment in self.segments():
+            done = self.ingested_offsets(segment) if filtered else set()
+            failed = self.failed_offsets(segment) if filtered else set()
+            for record in self.read_segment(segment):
+                if record.offset in done:
+                    continue
+                if (pending_only and record.offset in failed) or (failed_only and record.offset not in failed):
+                    continue
+                yield record
+
+    def pending_records(self, older_than=None, limit=None):
+        """Pending records fetched before older_than (epoch seconds), oldest first, at most limit"""
+        result = []
+        for record in self.records(pending_only=True):
+            if older_than is not None and record.fetched_at >= older_than:
+                continue
+            result.append(record)
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    def stats(self):
+        segments = self.segments()
+        total = pending = failed_count = size = 0
+        for segment in segments:
+            done = self.ingested_offsets(segment)
+            failed = self.failed_offsets(segment)
+            size += os.path.getsize(os.path.join(self.directory, segment))
+            for record in self.read_segment(segment):
+                total += 1
+                failed_count += record.offset in failed
+                pending += record.offset not in done and record.offset not in failed
+        return {"segments": len(segments), "records": total, "pending": pending, "failed": failed_count, "bytes": size}
+
+    def prune(self, now=None):
+        """Delete segments older than the retention period with no pending records
+
+        Страницы из карантина перед удалением сегмента сохраняются в quarantine/ как *.html.
+        """
+        cutoff = (now or time.time()) - self.retention_days * 86400
+        removed = []
+        for segment in self.segments():
+            path = os.path.join(self.directory, segment)
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            done = self.ingested_offsets(segment)
+            failed = self.failed_offsets(segment)
+            records = list(self.read_segment(segment))
+            if any(record.offset not in done and record.offset not in failed for record in records):
+                continue
+            quarantined = [record for record in records if record.offset in failed]
+            if quarantined:
+                write_pages(quarantined, os.path.join(self.directory, QUARANTINE_DIR))
+            for suffix in ("", DONE_SUFFIX, FAILED_SUFFIX):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            removed.append(segment)
+        return removed
+
+
+@lru_cache()
+def get_spool():
+    """Process-wide spool from settings, None if INGEST_SPOOL_DIR is empty"""
+    if not settings.ingest_spool_dir:
+        return None
+    return PayloadSpool(
+        settings.ingest_spool_dir,
+        fsync=settings.ingest_spool_fsync,
+        retention_days=settings.ingest_spool_retention_days
+    )
+
+
+def write_pages(records, out_dir):
+    """Write pages of records as <station>-<segment>-<offset>.html files, returns their number"""
+    os.makedirs(out_dir, exist_ok=True)
+    count = 0
+    for record in records:
+        name = f"{record.station_code}-{record.segment[:-len(SEGMENT_SUFFIX)]}-{record.offset}.html"
+        with open(os.path.join(out_dir, name), "w", encoding="utf-8") as f:
+            f.write(record.page)
+        count += 1
+    return count
+
+
+def export_pages(spool, out_dir):
+    """Write all spooled pages as HTML files"""
+    return write_pages(spool.records(), out_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect, replay and export the raw payload spool')
+    parser.add_argument('--dir', help='Spool directory (default: INGEST_SPOOL_DIR)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    replay = commands.add_parser('replay', help='Ingest spooled pages that were not stored yet')
+    replay.add_argument('--all', action='store_true', help='Replay every record, not only pending ones')
+    replay.add_argument('--failed', action='store_true', help='Replay only quarantined records')
+    commands.add_parser('stats')
+    commands.add_parser('prune')
+    export = commands.add_parser('export', help='Write spooled pages as HTML files')
+    export.add_argument('out_dir')
+    args = parser.parse_args()
+
+    spool = PayloadSpool(args.dir) if args.dir else get_spool()
+    if spool is None:
+        sys.exit("Spool is disabled (INGEST_SPOOL_DIR is empty) and --dir is not given")
+
+    if args.command == 'stats':
+        print(json.dumps(spool.stats()))
+    elif args.command == 'prune':
+        removed = spool.prune()
+        print(f"Removed {len(removed)} segment(s)")
+    elif args.command == 'export':
+        print(f"Exported {export_pages(spool, args.out_dir)} page(s) to {args.out_dir}")
+    else:
+        # Импорт здесь: конвейер загрузки сам импортирует этот модуль
+        from ingest_pipeline import IngestPipeline
+
+        records = spool.records(pending_only=not (args.all or args.failed), failed_only=args.failed)
+        total = asyncio.run(IngestPipeline(spool=spool).replay(records))
+        print(f"Replay finished: {total.inserted} rows inserted, {total.skipped} skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,6 @@
 import os
 import sys
-import signal
 import argparse
-import schedule
-import time
 from datetime import datetime
 import logging
 from logging.handlers import RotatingFileHandler
@@ -13,7 +10,7 @@ import asyncio
 
 # Добавляем родительскую директорию в путь поиска модулей
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from fill_measurements import update_all_stations
+from adaptive_polling import AdaptiveScheduler
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -63,57 +60,18 @@ logger = setup_logging()
 
 class Scheduler:
     def __init__(self, interval_minutes=15):
+        # Интервал для станций, период которых ещё не известен
         self.interval_minutes = interval_minutes
-        self.running = True
-        self.setup_signal_handlers()
     
-    def setup_signal_handlers(self):
-        """Setup signal handlers"""
-        signal.signal(signal.SIGTERM, self.handle_signal)
-        signal.signal(signal.SIGINT, self.handle_signal)
-    
-    def handle_signal(self, signum, frame):
-        """Handle termination signals"""
-        logger.info(f"Received signal {signum}. Shutting down...")
-        self.running = False
-        # Принудительно завершаем процесс
-        sys.exit(0)
-    
-    async def job(self):
-        """Scheduled job"""
-        logger.info("Starting scheduled data update")
+    def run(self):
+        """Run the adaptive per-station scheduler until SIGTERM/SIGINT"""
+        logger.info(f"Scheduler started. Stations with unknown cadence are polled every {self.interval_minutes} minutes.")
         try:
-            await update_all_stations()
-            logger.info("Scheduled data update completed successfully")
+            asyncio.run(AdaptiveScheduler(default_interval=self.interval_minutes * 60).run())
         except Exception as e:
-            logger.error(f"Error during scheduled data update: {str(e)}", exc_info=True)
-    
-    def run(self):
-        """Run scheduler"""
-        logger.info(f"Scheduler started. Will update data every {self.interval_minutes} minutes.")
-        
-        # Create new event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # Schedule updates
-        schedule.every(self.interval_minutes).minutes.do(
-            lambda: loop.run_until_complete(self.job())
-        )
-        
-        # Run first update immediately
-        loop.run_until_complete(self.job())
-        
-        while self.running:
-            try:
-                schedule.run_pending()
-                time.sleep(60)  # Check every minute
-            except Exception as e:
-                logger.error(f"Error in scheduler main loop: {str(e)}", exc_info=True)
-                time.sleep(60)  # Wait a minute before next try on error
-        
-        # Close event loop
-        loop.close()
+            logger.error(f"Error in scheduler main loop: {str(e)}", exc_info=True)
+            raise
+        logger.info("Scheduler stopped")
 
 def run_as_daemon(script_path, pid_file, log_file):
     """Запуск скрипта в фоновом режиме в Windows"""
@@ -1,8 +1,6 @@
 import requests
-from bs4 import BeautifulSoup
 import json
 import urllib3
-import re
 from urllib.parse import quote
 import time
 from datetime import datetime
@@ -11,144 +9,98 @@ import os
 
 # Добавляем родительскую директорию в путь поиска модулей
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.config import settings
 from app.database import SessionLocal
 from app import models
+from fetcher import fetch_response
+from fetch_cache import UNCHANGED, fetch_cache
+from payload_parser import parse_graph_page, parse_stations_page, preprocess_js_object
+from station_series import StationSeries
 
 # Отключаем предупреждения о небезопасных запросах
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def preprocess_js_object(js_str):
-    # Remove any trailing commas before closing braces/brackets
-    js_str = re.sub(r',(\s*[}\]])', r'\1', js_str)
-    # Replace single quotes with double quotes for JSON compatibility
-    js_str = re.sub(r"'", '"', js_str)
-    # Remove any comments
-    js_str = re.sub(r'//.*?\n', '\n', js_str)
-    # Add quotes around property names
-    js_str = re.sub(r'([{,])\s*([a-zA-Z0-9_]+)\s*:', r'\1"\2":', js_str)
-    return js_str
-
 def generate_graph_url(station_id, station_name, days=14):
     """Generate URL for station graph"""
-    base_url = "https://www.meteo.co.me/Hidrologija/aws-graph-h.php"
+    base_url = f"{settings.upstream_base_url}/aws-graph-h.php"
     encoded_name = quote(station_name)
     return f"{base_url}?s={station_id}&d={days}d&name={encoded_name}"
 
-def get_station_data(station_id, station_name, days=14):
-    """Get water level and temperature data from station graph page"""
+def parse_station_data(page_text):
+    """Parse water level and temperature series from station graph page"""
+    # Минутные данные (Data_m), а при их отсутствии часовые (Data_h)
+    return StationSeries.from_page_series(parse_graph_page(page_text))
+
+def get_station_data(station_id, station_name, days=14, cache=fetch_cache):
+    """Get water level and temperature data from station graph page
+
+    Returns UNCHANGED if the page is the same as on the previous fetch.
+    """
     try:
         graph_url = generate_graph_url(station_id, station_name, days)
-        response = requests.get(graph_url, verify=False)
+        headers = cache.conditional_headers(station_id, graph_url) if cache is not None else {}
+        response = requests.get(graph_url, headers=headers, verify=False)
         response.raise_for_status()
-        
-        # Ищем данные в JavaScript-коде
-        data_matches = re.findall(r'var\s+Data_m\s*=\s*(\{.*?\});', response.text, re.DOTALL)
-        data_h_matches = re.findall(r'var\s+Data_h\s*=\s*(\{.*?\});', response.text, re.DOTALL)
-        
-        data = {
-            'water_level': [],
-            'temperature': [],
-            'timestamps': []
-        }
-        
-        # Обрабатываем данные из Data_m (минутные данные)
-        if data_matches:
-            data_m_str = preprocess_js_object(data_matches[0])
-            try:
-                data_m = json.loads(data_m_str)
-                if 'G1' in data_m and 'V' in data_m['G1'] and 'Tv' in data_m['G1']:
-                    # Собираем данные о температуре
-                    for point in data_m['G1']['Tv']:
-                        if len(point) >= 2:
-                            timestamp = datetime.fromtimestamp(point[0]/1000)
-                            temperature = point[1] if point[1] is not None else None
-                            data['timestamps'].append(timestamp)
-                            data['temperature'].append(temperature)
-                    
-                    # Собираем данные об уровне воды
-                    for point in data_m['G1']['V']:
-                        if len(point) >= 2:
-                            timestamp = datetime.fromtimestamp(point[0]/1000)
-                            water_level = point[1] if point[1] is not None else None
-                            data['timestamps'].append(timestamp)
-                            data['water_level'].append(water_level)
-            except json.JSONDecodeError as e:
-                print(f"Error parsing Data_m JSON for station {station_id}: {e}")
-                print("Problematic string:", data_m_str)
-        
-        # Обрабатываем данные из Data_h (часовые данные)
-        if data_h_matches:
-            data_h_str = preprocess_js_object(data_h_matches[0])
-            try:
-                data_h = json.loads(data_h_str)
-                if 'G1' in data_h and 'V' in data_h['G1'] and 'Tv' in data_h['G1']:
-                    # Добавляем часовые данные, если минутные отсутствуют
-                    if not data['timestamps']:
-                        for point in data_h['G1']['Tv']:
-                            if len(point) >= 2:
-                                timestamp = datetime.fromtimestamp(point[0]/1000)
-                                temperature = point[1] if point[1] is not None else None
-                                data['timestamps'].append(timestamp)
-                                data['temperature'].append(temperature)
-                        
-                        for point in data_h['G1']['V']:
-                            if len(point) >= 2:
-                                timestamp = datetime.fromtimestamp(point[0]/1000)
-                                water_level = point[1] if point[1] is not None else None
-                                data['timestamps'].append(timestamp)
-                                data['water_level'].append(water_level)
-            except json.JSONDecodeError as e:
-                print(f"Error parsing Data_h JSON for station {station_id}: {e}")
-                print("Problematic string:", data_h_str)
-        
-        return data
+        if cache is not None and not cache.store(station_id, graph_url, response.status_code,
+                                                 response.headers, response.text):
+            return UNCHANGED
+        return parse_station_data(response.text)
     except requests.RequestException as e:
         print(f"Error fetching station data for {station_id}: {e}")
         return None
 
-def get_station_links():
-    url = "https://www.meteo.co.me/Hidrologija/aws_h.php"
+async def fetch_station_page(session, station_id, station_name, days=14, limiter=None,
+                             timeout=30.0, retries=3, backoff=1.0, cache=fetch_cache):
+    """Fetch the raw station graph page, UNCHANGED if it is the same as on the previous fetch"""
+    graph_url = generate_graph_url(station_id, station_name, days)
+    headers = cache.conditional_headers(station_id, graph_url) if cache is not None else {}
+    status, response_headers, page_text = await fetch_response(
+        session, graph_url, headers=headers, limiter=limiter, timeout=timeout,
+        retries=retries, backoff=backoff
+    )
+    if cache is not None and not cache.store(station_id, graph_url, status, response_headers, page_text):
+        return UNCHANGED
+    return page_text
+
+async def fetch_station_data(session, station_id, station_name, days=14, limiter=None,
+                             timeout=30.0, retries=3, backoff=1.0, cache=fetch_cache):
+    """Asynchronous variant of get_station_data on a shared aiohttp session"""
+    page_text = await fetch_station_page(session, station_id, station_name, days, limiter,
+                                         timeout, retries, backoff, cache)
+    if page_text is UNCHANGED:
+        return UNCHANGED
+    return parse_station_data(page_text)
+
+def get_station_links(fetch_data=True):
+    """Station list from aws_h.php; with fetch_data the graph data of every station is saved to station_data.json"""
+    url = f"{settings.upstream_base_url}/aws_h.php"
     
     try:
         response = requests.get(url, verify=False)
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Ищем все теги <script>
-        scripts = soup.find_all('script')
         all_stations = []
         
-        for script in scripts:
-            script_text = script.string
-            if script_text:
-                # Ищем объект staniceH
-                staniceH_match = re.search(r'var\s+staniceH\s*=\s*(\{.*?\});', script_text, re.DOTALL)
-                if staniceH_match:
-                    staniceH_str = staniceH_match.group(1)
-                    # Preprocess the JavaScript object string
-                    staniceH_str = preprocess_js_object(staniceH_str)
-                    try:
-                        staniceH = json.loads(staniceH_str)
-                        # Combine all stations into a single list
-                        if 'jadranski' in staniceH:
-                            for station in staniceH['jadranski']:
-                                station.append(generate_graph_url(station[0], station[5]))
-                            all_stations.extend(staniceH['jadranski'])
-                        if 'crnomorski' in staniceH:
-                            for station in staniceH['crnomorski']:
-                                station.append(generate_graph_url(station[0], station[5]))
-                            all_stations.extend(staniceH['crnomorski'])
-                        break
-                    except json.JSONDecodeError as e:
-                        print(f"Error parsing JSON: {e}")
-                        print("Problematic string:", staniceH_str)
-                        continue
+        # Ищем объект staniceH
+        try:
+            staniceH = parse_stations_page(response.text)
+        except json.JSONDecodeError as e:
+            print(f"Error parsing JSON: {e}")
+            staniceH = None
+        
+        if staniceH:
+            # Combine all stations into a single list
+            for region in ('jadranski', 'crnomorski'):
+                for station in staniceH.get(region, []):
+                    station.append(generate_graph_url(station[0], station[5]))
+                all_stations.extend(staniceH.get(region, []))
         
         if all_stations:
             # Сохраняем базовую информацию о станциях
             with open('station_links.json', 'w', encoding='utf-8') as f:
                 json.dump(all_stations, f, ensure_ascii=False, indent=4)
             print(f"Все станции найдены и сохранены в station_links.json")
+            if not fetch_data:
+                return all_stations
             
             # Получаем данные для каждой станции
             station_data = {}
@@ -158,10 +110,10 @@ def get_station_links():
                 
                 print(f"Получение данных для станции {station_name} ({station_id})...")
                 data = get_station_data(station_id, station_name)
-                if data:
+                if data is not None and data is not UNCHANGED:
                     station_data[station_id] = {
                         'name': station_name,
-                        'data': data
+                        'data': data.to_dict()
                     }
                 time.sleep(1)  # Задержка между запросами
             
@@ -179,11 +131,14 @@ def get_station_links():
         print(f"Ошибка при получении данных: {e}")
         return []
 
-def fill_stations_table():
-    """Fill stations table with data from the website"""
+def fill_stations_table(fetch_data=True):
+    """Fill stations table with data from the website
+
+    fetch_data=False пропускает загрузку данных всех станций в station_data.json (см. get_station_links).
+    """
     db = SessionLocal()
     try:
-        stations = get_station_links()
+        stations = get_station_links(fetch_data)
         if not stations:
             print("Станции не найдены")
             return
@@ -203,8 +158,12 @@ def fill_stations_table():
             existing_station = db.query(models.Station).filter(models.Station.code == station_data['code']).first()
             if existing_station:
                 # Обновляем существующую станцию
+                changed = any(getattr(existing_station, key) != value for key, value in station_data.items())
                 for key, value in station_data.items():
                     setattr(existing_station, key, value)
+                if changed:
+                    # Новый last_updated - сигнал кэшам станций в процессах API перечитать таблицу
+                    existing_station.last_updated = datetime.now()
             else:
                 # Создаем новую станцию
                 new_station = models.Station(**station_data)
@@ -42,6 +42,9 @@ source venv/bin/activate
 pip install --upgrade pip
 pip install -r requirements.txt
 
+# Schema and partitions are created explicitly; the API does not touch the database on import
+python scripts/init_db.py
+
 # Create systemd service for scheduler
 sudo tee /etc/systemd/system/waterlevel-scheduler.service << EOF
 [Unit]
@@ -0,0 +1,134 @@
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import numpy as np
+
+METRICS = ('water_level', 'temperature')
+# Ключи рядов на странице графика
+PAGE_KEYS = {'water_level': 'V', 'temperature': 'Tv'}
+# Значащих десятичных цифр, которые float32 сохраняет без потерь
+FLOAT32_DIGITS = 7
+
+
+class MetricSeries(NamedTuple):
+    timestamps: np.ndarray  # int64, epoch ms
+    values: np.ndarray  # float32
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+
+    @classmethod
+    def from_points(cls, timestamps, values):
+        """Drop null (NaN) points, sort by time and keep the last value for repeated timestamps"""
+        values = np.asarray(values, dtype=np.float32)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        keep = ~np.isnan(values)
+        timestamps, values = timestamps[keep], values[keep]
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[order]
+        if len(timestamps) > 1:
+            last = np.append(timestamps[1:] != timestamps[:-1], True)
+            timestamps, values = timestamps[last], values[last]
+        return cls(timestamps, values)
+
+    def after(self, mark_ms):
+        """Points strictly newer than mark_ms (None keeps everything)"""
+        if mark_ms is None:
+            return self
+        start = np.searchsorted(self.timestamps, mark_ms, side='right')
+        return MetricSeries(self.timestamps[start:], self.values[start:])
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+class StationSeries:
+    """Parsed station data: one (timestamps, values) pair per metric"""
+
+    def __init__(self, water_level=None, temperature=None):
+        self.water_level = water_level if water_level is not None else MetricSeries.empty()
+        self.temperature = temperature if temperature is not None else MetricSeries.empty()
+
+    @classmethod
+    def from_page_series(cls, series):
+        """Build from payload_parser.parse_graph_page output"""
+        if not series:
+            return cls()
+        return cls(**{
+            metric: MetricSeries.from_points(*series[key])
+            for metric, key in PAGE_KEYS.items()
+        })
+
+    def metric(self, name):
+        return getattr(self, name)
+
+    def __bool__(self):
+        return bool(len(self.water_level) or len(self.temperature))
+
+    def point_count(self):
+        return len(self.water_level) + len(self.temperature)
+
+    def latest(self):
+        """Latest timestamp (epoch ms) per metric, None for an empty metric"""
+        return {
+            metric: int(self.metric(metric).timestamps[-1]) if len(self.metric(metric)) else None
+            for metric in METRICS
+        }
+
+    def after(self, marks):
+        """Drop points at or below the per-metric high-water marks (epoch ms)"""
+        marks = marks or {}
+        return StationSeries(**{
+            metric: self.metric(metric).after(marks.get(metric))
+            for metric in METRICS
+        })
+
+    def aligned(self):
+        """Join metrics on timestamp with a sorted merge, returns (timestamps, water_level, temperature) with NaN gaps"""
+        timestamps = np.union1d(self.water_level.timestamps, self.temperature.timestamps)
+        columns = []
+        for metric in METRICS:
+            series = self.metric(metric)
+            column = np.full(len(timestamps), np.nan, dtype=np.float32)
+            column[np.searchsorted(timestamps, series.timestamps)] = series.values
+            columns.append(column)
+        return (timestamps, *columns)
+
+    def to_dict(self):
+        """JSON-friendly representation, aligned on timestamp"""
+        timestamps, water_level, temperature = self.aligned()
+        return {
+            'timestamps': [datetime.fromtimestamp(ms / 1000).isoformat() for ms in timestamps.tolist()],
+            'water_level': [None if np.isnan(v) else v for v in to_float64(water_level).tolist()],
+            'temperature': [None if np.isnan(v) else v for v in to_float64(temperature).tolist()],
+        }
+
+
+def to_float64(values):
+    """Widen float32 values rounded to float32 precision, so 12.3 stays 12.3 and not 12.300000190734863
+
+    Округление до FLOAT32_DIGITS значащих цифр векторное, без строки на точку; для значений станций
+    (несколько знаков после запятой) результат совпадает с кратчайшей десятичной записью float32.
+    """
+    wide = values.astype(np.float64)
+    rounded = np.isfinite(wide) & (wide != 0)
+    magnitude = np.floor(np.log10(np.abs(wide, where=rounded, out=np.ones_like(wide))))
+    scale = 10.0 ** (FLOAT32_DIGITS - 1 - magnitude)
+    return np.where(rounded, np.round(wide * scale) / scale, wide)
+
+
+def to_local_datetimes(timestamps_ms, offset_seconds=0):
+    """Convert epoch ms to naive local datetimes (as datetime.fromtimestamp does) shifted by offset_seconds"""
+    if not len(timestamps_ms):
+        return []
+    first = int(timestamps_ms[0]) // 1000
+    last = int(timestamps_ms[-1]) // 1000
+    utc_offset = time.localtime(first).tm_gmtoff
+    if utc_offset != time.localtime(last).tm_gmtoff:
+        # Переход на летнее/зимнее время внутри окна - считаем поточечно
+        offset = timedelta(seconds=offset_seconds)
+        return [datetime.fromtimestamp(ms / 1000) + offset for ms in timestamps_ms.tolist()]
+    shifted = timestamps_ms + (utc_offset + offset_seconds) * 1000
+    return shifted.astype('datetime64[ms]').tolist()